@@ -0,0 +1,229 @@
+"""
+Benchmarks for the Country Relocation Agent
+Run all of them with `python benchmark.py`, or pick some: `python benchmark.py row_memory`
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from country_relocation_agent import METRIC_FIELDS, CountryRelocationAgent, CountryStore, UserCriteria, dumps_countries
+
+
+@dataclass
+class LegacyCountryData:
+    """The original dataclass row layout, kept for before/after comparisons"""
+    name: str
+    cost_of_living_index: float
+    quality_of_life_index: float
+    safety_index: float
+    healthcare_index: float
+    climate_score: float
+    job_market_score: float
+    english_proficiency: float
+    visa_ease: float
+    tax_friendliness: float
+    internet_speed: float
+    expat_community_size: str
+
+
+def random_rows(count: int, seed: int = 0):
+    """Synthetic (name, metrics, expat size) rows with integer metrics"""
+    rng = random.Random(seed)
+    sizes = ('Small', 'Medium', 'Large')
+    return [
+        (f"City {i:07d}", tuple(rng.randint(0, 100) for _ in METRIC_FIELDS), rng.choice(sizes))
+        for i in range(count)
+    ]
+
+
+def _allocated_bytes(build) -> int:
+    """Bytes still allocated after build() returns (its result is kept alive)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def bench_row_memory(count: int = 100_000):
+    """Bytes per row: legacy dataclass objects vs the columnar CountryStore"""
+    rows = random_rows(count)
+
+    def build_legacy():
+        return [
+            LegacyCountryData(name, *(float(value) for value in metrics), expat)
+            for name, metrics, expat in rows
+        ]
+
+    def build_store():
+        store = CountryStore()
+        for name, metrics, expat in rows:
+            store.append_row(name, metrics, expat)
+        return store
+
+    legacy = _allocated_bytes(build_legacy) / count
+    columnar = _allocated_bytes(build_store) / count
+    print(f"row_memory ({count:,} rows, name strings excluded)")
+    print(f"  dataclass rows: {legacy:8.1f} bytes/row")
+    print(f"  CountryStore:   {columnar:8.1f} bytes/row  ({legacy / columnar:.1f}x smaller)")
+
+
+def _best_of(run, repeat: int = 3) -> float:
+    """Best wall-clock time of several runs, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _random_store(count: int) -> CountryStore:
+    store = CountryStore()
+    for name, metrics, expat in random_rows(count):
+        store.append_row(name, metrics, expat)
+    return store
+
+
+def bench_serialization(count: int = 100_000):
+    """JSON for a full result set: per-row to_dict + json.dumps vs dumps_countries"""
+    countries = list(_random_store(count))
+    per_row = _best_of(lambda: json.dumps([country.to_dict() for country in countries]))
+    rows = _best_of(lambda: dumps_countries(countries))
+    columnar = _best_of(lambda: dumps_countries(countries, columnar=True))
+    print(f"serialization ({count:,} rows)")
+    print(f"  to_dict + json.dumps:         {per_row * 1e3:8.1f} ms")
+    print(f"  dumps_countries:              {rows * 1e3:8.1f} ms")
+    print(f"  dumps_countries(columnar):    {columnar * 1e3:8.1f} ms")
+
+
+def legacy_explain(country, score: float, breakdown) -> str:
+    """The original += explain_recommendation, kept for before/after comparisons"""
+    explanation = f"\n{'='*60}\n"
+    explanation += f"Country: {country.name}\n"
+    explanation += f"Overall Score: {score:.2f}/100\n"
+    explanation += f"{'='*60}\n\n"
+
+    explanation += "Score Breakdown:\n"
+    explanation += "-" * 60 + "\n"
+
+    criteria_names = {
+        'cost_of_living_index': 'Cost of Living (inverted)',
+        'quality_of_life_index': 'Quality of Life',
+        'safety_index': 'Safety',
+        'healthcare_index': 'Healthcare',
+        'climate_score': 'Climate',
+        'job_market_score': 'Job Market',
+        'english_proficiency': 'English Proficiency',
+        'visa_ease': 'Visa Accessibility',
+        'tax_friendliness': 'Tax Friendliness'
+    }
+
+    for criterion, weighted_score in sorted(breakdown.items(), key=lambda x: x[1], reverse=True):
+        display_name = criteria_names.get(criterion, criterion)
+        explanation += f"  {display_name:.<40} {weighted_score:>6.2f}\n"
+
+    explanation += "\nKey Statistics:\n"
+    explanation += "-" * 60 + "\n"
+    explanation += f"  Cost of Living Index: {country.cost_of_living_index:g}/100 (lower is cheaper)\n"
+    explanation += f"  Safety Index: {country.safety_index:g}/100\n"
+    explanation += f"  Healthcare Index: {country.healthcare_index:g}/100\n"
+    explanation += f"  Average Internet Speed: {country.internet_speed:g} Mbps\n"
+    explanation += f"  Expat Community: {country.expat_community_size}\n"
+
+    return explanation
+
+
+def bench_explain(count: int = 10_000):
+    """Per-explanation cost of rendering count recommendations: legacy += vs templates vs explain_many"""
+    agent = CountryRelocationAgent(shared=False)
+    agent.countries = _random_store(count)
+    results = agent.recommend_countries(UserCriteria(), top_n=count)
+    assert [legacy_explain(*result) for result in results] == agent.explain_many(results)
+
+    legacy = _best_of(lambda: [legacy_explain(*result) for result in results])
+    single = _best_of(lambda: [agent.explain_recommendation(*result) for result in results])
+    many = _best_of(lambda: agent.explain_many(results))
+    print(f"explain ({len(results):,} renders)")
+    print(f"  legacy += concatenation:  {legacy / len(results) * 1e6:6.2f} us/explanation")
+    print(f"  explain_recommendation:   {single / len(results) * 1e6:6.2f} us/explanation  ({legacy / single:.1f}x)")
+    print(f"  explain_many:             {many / len(results) * 1e6:6.2f} us/explanation  ({legacy / many:.1f}x)")
+
+
+# Cumulative `python -X importtime` cost of importing the agent module, in microseconds
+# typing is imported for real so typing.get_type_hints() works; it costs about 8 ms of this
+IMPORT_BUDGET_US = 60_000
+
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from country_relocation_agent import CountryRelocationAgent, UserCriteria
+imported = time.perf_counter()
+agent = CountryRelocationAgent()
+constructed = time.perf_counter()
+agent.recommend_countries(UserCriteria())
+print(imported - start, constructed - imported, time.perf_counter() - constructed)
+"""
+
+
+def _run_python(*args: str) -> subprocess.CompletedProcess:
+    """Run a fresh interpreter next to this file so nothing is imported yet"""
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+
+
+def _import_time_us(module: str) -> int:
+    """Cumulative import time of a module as reported by -X importtime"""
+    for line in _run_python('-X', 'importtime', '-c', f'import {module}').stderr.splitlines():
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative)
+    raise RuntimeError(f"{module} missing from -X importtime output")
+
+
+def bench_startup(repeat: int = 5):
+    """Cold-start cost: module import (checked against IMPORT_BUDGET_US), agent construction, first query"""
+    import_us = min(_import_time_us('country_relocation_agent') for _ in range(repeat))
+    runs = [tuple(map(float, _run_python('-c', _STARTUP_SCRIPT).stdout.split())) for _ in range(repeat)]
+    imported, constructed, first_query = (min(timings) for timings in zip(*runs))
+    within_budget = import_us <= IMPORT_BUDGET_US
+    print(f"startup (best of {repeat} fresh interpreters)")
+    print(f"  import (-X importtime):   {import_us / 1e3:8.1f} ms  "
+          f"(budget {IMPORT_BUDGET_US / 1e3:.0f} ms{'' if within_budget else ', EXCEEDED'})")
+    print(f"  import (wall clock):      {imported * 1e3:8.1f} ms")
+    print(f"  CountryRelocationAgent(): {constructed * 1e3:8.1f} ms")
+    print(f"  first recommendation:     {first_query * 1e3:8.1f} ms  (loads data and engine)")
+    return within_budget
+
+
+BENCHMARKS = {
+    'row_memory': bench_row_memory,
+    'serialization': bench_serialization,
+    'explain': bench_explain,
+    'startup': bench_startup,
+}
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}; available: {', '.join(BENCHMARKS)}")
+        return 2
+    # A benchmark returning False failed a budget check
+    failed = [name for name in names if BENCHMARKS[name]() is False]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,42 +3,1803 @@ AI Agent for Country Relocation Recommendation
 This agent helps users find the best country to move to based on their specific criteria.
 """
 
-import json
-from typing import Dict, List, Tuple
-from dataclasses import dataclass, field
+from __future__ import annotations
+
+import heapq
+import math
+import operator
+import os
+import struct
+import sys
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from enum import IntEnum
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Optional accelerators are imported on first use, not at module import:
+# NumPy alone costs several times the rest of the module's import time
+np = None
+orjson = None
+_UNLOADED = object()
+_optional_modules: Dict[str, object] = {}
+
+
+def _load_optional(name: str):
+    """Import an optional dependency once; returns None when it is not installed"""
+    module = _optional_modules.get(name, _UNLOADED)
+    if module is _UNLOADED:
+        try:
+            module = __import__(name)
+        except ImportError:
+            module = None
+        _optional_modules[name] = module
+    return module
+
+
+def _load_numpy():
+    """NumPy, or None: scoring falls back to pure Python without it"""
+    global np
+    np = _load_optional('numpy')
+    return np
+
+
+def _load_orjson():
+    """orjson, or None: serialization falls back to the stdlib encoder without it"""
+    global orjson
+    orjson = _load_optional('orjson')
+    return orjson
+
+
+# How each normalization maps raw values onto 0-100 (see MetricSpec)
+NORMALIZATIONS = ('minmax', 'capped', 'log', 'zscore')
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """
+    How a metric column is scored
+    Every normalization maps raw values onto a 0-100 scale where higher is
+    better, so scoring is a plain weighted sum of normalized columns:
+    - minmax: linear over [low, high] (None takes the dataset's min / max)
+    - capped: like minmax, but values outside the range score 0 or 100
+    - log: linear over log1p of the capped value, for long-tailed metrics
+    - zscore: linear over mean +- 3 standard deviations of the dataset, capped
+    """
+    label: str  # Display name in explanations
+    higher_is_better: bool = True
+    low: Optional[float] = 0.0  # Expected raw range
+    high: Optional[float] = 100.0
+    normalization: str = 'minmax'
+    
+    def __post_init__(self):
+        if self.normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown normalization {self.normalization!r}; expected one of {NORMALIZATIONS}")
+        if self.normalization in ('capped', 'log') and (self.low is None or self.high is None):
+            raise ValueError(f"{self.normalization} normalization needs a fixed low and high")
+        if self.low is not None and self.high is not None and not self.low < self.high:
+            raise ValueError(f"low must be below high, got {self.low} and {self.high}")
+        if self.normalization == 'log' and self.low <= -1:
+            raise ValueError(f"log normalization needs low > -1, got {self.low}")
+    
+    @property
+    def row_local(self) -> bool:
+        """Whether a value normalizes on its own, without statistics of the rest of the column"""
+        return self.normalization != 'zscore' and self.low is not None and self.high is not None
+    
+    def bounds(self, values) -> Tuple[float, float]:
+        """Raw interval mapped onto 0-100 for a column of values"""
+        if self.normalization == 'zscore':
+            if not len(values):
+                return 0.0, 0.0
+            mean = math.fsum(values) / len(values)
+            deviation = math.sqrt(math.fsum((value - mean) ** 2 for value in values) / len(values))
+            return mean - 3 * deviation, mean + 3 * deviation
+        low = (min(values) if len(values) else 0.0) if self.low is None else self.low
+        high = (max(values) if len(values) else 0.0) if self.high is None else self.high
+        return low, high
+    
+    def _linear(self, bounds: Tuple[float, float]) -> Tuple[float, float, float]:
+        """(low, high, scale) in the space values are mapped from; a zero-width range scores 0"""
+        low, high = bounds
+        if self.normalization == 'log':
+            low, high = math.log1p(low), math.log1p(high)
+        return low, high, 100 / (high - low) if high > low else 0.0
+    
+    def normalize(self, value: float, bounds: Tuple[float, float]) -> float:
+        """Normalize one raw value given the column's bounds"""
+        low, high, scale = self._linear(bounds)
+        if self.normalization == 'log':
+            value = math.log1p(min(max(value, bounds[0]), bounds[1]))
+        score = (value - low) * scale if self.higher_is_better else (high - value) * scale
+        if self.normalization != 'minmax':
+            score = min(max(score, 0.0), 100.0)
+        return score
+    
+    def normalize_column(self, values) -> array:
+        """Normalize a whole column into a new array('d')"""
+        bounds = self.bounds(values)
+        return array('d', [self.normalize(value, bounds) for value in values])
+    
+    def normalize_array(self, raw: 'np.ndarray') -> 'np.ndarray':
+        """Vectorized normalize_column for a NumPy row of the raw matrix"""
+        if self.normalization == 'zscore':
+            mean, deviation = (raw.mean(), raw.std()) if len(raw) else (0.0, 0.0)
+            bounds = (mean - 3 * deviation, mean + 3 * deviation)
+        else:
+            bounds = (
+                (raw.min() if len(raw) else 0.0) if self.low is None else self.low,
+                (raw.max() if len(raw) else 0.0) if self.high is None else self.high
+            )
+        low, high, scale = self._linear(bounds)
+        values = np.log1p(np.clip(raw, *bounds)) if self.normalization == 'log' else raw
+        scores = (values - low) * scale if self.higher_is_better else (high - values) * scale
+        if self.normalization != 'minmax':
+            scores = np.clip(scores, 0.0, 100.0)
+        return scores
+
+
+# Numeric columns of the country store, in storage order, and how each is scored
+METRIC_SPECS = {
+    'cost_of_living_index': MetricSpec('Cost of Living', higher_is_better=False),  # 0-100, lower is cheaper
+    'quality_of_life_index': MetricSpec('Quality of Life'),  # 0-100, higher is better
+    'safety_index': MetricSpec('Safety'),  # 0-100, higher is safer
+    'healthcare_index': MetricSpec('Healthcare'),  # 0-100, higher is better
+    'climate_score': MetricSpec('Climate'),  # 0-100, higher is better weather
+    'job_market_score': MetricSpec('Job Market'),  # 0-100, higher is better opportunities
+    'english_proficiency': MetricSpec('English Proficiency'),  # 0-100, higher means better English
+    'visa_ease': MetricSpec('Visa Accessibility'),  # 0-100, higher means easier to get visa
+    'tax_friendliness': MetricSpec('Tax Friendliness'),  # 0-100, higher means lower taxes
+    # Mbps average: unbounded and long-tailed, so it is log-scaled and anything from 500 Mbps up scores 100
+    'internet_speed': MetricSpec('Internet Speed', low=0.0, high=500.0, normalization='log'),
+}
+METRIC_FIELDS = tuple(METRIC_SPECS)
+METRIC_INDEX = {name: index for index, name in enumerate(METRIC_FIELDS)}
+# Optional free-text location tags; rows without them are stored as ''
+REGION_FIELDS = ('region', 'sub_region')
+COUNTRY_FIELDS = ('name',) + METRIC_FIELDS + ('expat_community_size',) + REGION_FIELDS
+
+DEFAULT_WEIGHTS = {
+    'cost_of_living_index': 0.15,
+    'quality_of_life_index': 0.20,
+    'safety_index': 0.15,
+    'healthcare_index': 0.10,
+    'climate_score': 0.10,
+    'job_market_score': 0.10,
+    'english_proficiency': 0.05,
+    'visa_ease': 0.10,
+    'tax_friendliness': 0.05
+}
+
+# Other names name lookups accept for each country, including ISO 3166 alpha-2 and alpha-3 codes
+COUNTRY_ALIASES = {
+    'Portugal': ('PT', 'PRT', 'Portuguese Republic'),
+    'Spain': ('ES', 'ESP', 'España', 'Kingdom of Spain'),
+    'Thailand': ('TH', 'THA', 'Siam', 'Kingdom of Thailand'),
+    'Germany': ('DE', 'DEU', 'Deutschland', 'Federal Republic of Germany'),
+    'Mexico': ('MX', 'MEX', 'México', 'United Mexican States'),
+    'Canada': ('CA', 'CAN'),
+    'Australia': ('AU', 'AUS', 'Commonwealth of Australia'),
+    'Estonia': ('EE', 'EST', 'Eesti', 'Republic of Estonia'),
+    'New Zealand': ('NZ', 'NZL', 'Aotearoa'),
+    'Costa Rica': ('CR', 'CRI', 'Republic of Costa Rica'),
+    'Singapore': ('SG', 'SGP', 'Republic of Singapore'),
+    'Czech Republic': ('CZ', 'CZE', 'Czechia'),
+}
+
+
+def _fold_name(name: str) -> str:
+    """Lookup key for a country name or alias: case and surrounding whitespace are ignored"""
+    return name.strip().casefold()
+
+
+_DEFAULT_ALIASES = {
+    _fold_name(alias): name for name, aliases in COUNTRY_ALIASES.items() for alias in aliases
+}
+
+
+class ExpatCommunitySize(IntEnum):
+    """Size of the expat community, stored as one byte per row"""
+    SMALL = 0
+    MEDIUM = 1
+    LARGE = 2
+    
+    @property
+    def label(self) -> str:
+        return self.name.capitalize()
+    
+    @classmethod
+    def parse(cls, value: Union[str, int, 'ExpatCommunitySize']) -> 'ExpatCommunitySize':
+        """Accept an enum member, its integer code or a label like 'Medium'"""
+        if isinstance(value, str):
+            try:
+                return cls[value.strip().upper()]
+            except KeyError:
+                raise ValueError(f"Unknown expat community size {value!r}; expected Small, Medium or Large") from None
+        return cls(value)
+
+
+_EXPAT_LABELS = tuple(size.label for size in ExpatCommunitySize)
+
+
+@dataclass(frozen=True)
+class DealBreaker:
+    """
+    A named reason to rule a country out: its value for field is below
+    `below` or above `above` (expat_community_size compares enum codes)
+    """
+    field: str
+    below: Optional[float] = None
+    above: Optional[float] = None
+    description: str = ''
+    
+    def __post_init__(self):
+        if self.field not in METRIC_INDEX and self.field != 'expat_community_size':
+            raise ValueError(f"Deal breakers can only test numeric fields, got {self.field!r}")
+    
+    def excludes(self, value: float) -> bool:
+        return (self.below is not None and value < self.below) or (self.above is not None and value > self.above)
+
+
+# Deal breakers UserCriteria.deal_breakers can name; add entries to define your own
+DEAL_BREAKERS: Dict[str, DealBreaker] = {
+    'small_expat_community': DealBreaker('expat_community_size', below=ExpatCommunitySize.MEDIUM,
+                                         description='Small expat community'),
+    'no_english': DealBreaker('english_proficiency', below=50, description='English proficiency below 50'),
+    'high_cost': DealBreaker('cost_of_living_index', above=70, description='Cost of living index above 70'),
+    'unsafe': DealBreaker('safety_index', below=60, description='Safety index below 60'),
+    'weak_healthcare': DealBreaker('healthcare_index', below=60, description='Healthcare index below 60'),
+    'poor_climate': DealBreaker('climate_score', below=60, description='Climate score below 60'),
+    'weak_job_market': DealBreaker('job_market_score', below=60, description='Job market score below 60'),
+    'hard_visa': DealBreaker('visa_ease', below=55, description='Visa ease below 55'),
+    'high_taxes': DealBreaker('tax_friendliness', below=50, description='Tax friendliness below 50'),
+    'slow_internet': DealBreaker('internet_speed', below=50, description='Internet slower than 50 Mbps'),
+}
+
+
+def _checked_metrics(name: str, metrics: Iterable[float]) -> List[float]:
+    """Metric values of one row as floats, or ValueError when there are too few or one is not finite"""
+    values = [float(value) for value in metrics]
+    if len(values) != len(METRIC_FIELDS):
+        raise ValueError(f"Expected {len(METRIC_FIELDS)} metric values, got {len(values)}")
+    if not all(map(math.isfinite, values)):
+        raise ValueError(f"Metric values for {name!r} must be finite numbers")
+    return values
+
+
+def _metric_property(name: str) -> property:
+    """Build a CountryData attribute that reads/writes one store column"""
+    index = METRIC_INDEX[name]
+    
+    def getter(self):
+        if self._store is None:
+            return self._row[index + 1]
+        return self._store.columns[index][self._row]
+    
+    def setter(self, value):
+        store = self._attach()
+        store.set_value(self._row, index, value)
+    
+    return property(getter, setter, doc=f"Value of the '{name}' column for this row")
+
+
+def _bind_country_fields(values: Tuple, fields: Dict) -> Dict:
+    """Map CountryData's positional and keyword arguments after name to field names, like a fixed signature would"""
+    parameters = COUNTRY_FIELDS[1:]
+    if len(values) > len(parameters):
+        raise TypeError(f"CountryData() takes at most {len(parameters) + 1} positional arguments "
+                        f"({len(values) + 1} given)")
+    bound = dict(zip(parameters, values))
+    for key, value in fields.items():
+        if key not in parameters:
+            raise TypeError(f"CountryData() got an unexpected keyword argument {key!r}")
+        if key in bound:
+            raise TypeError(f"CountryData() got multiple values for argument {key!r}")
+        bound[key] = value
+    missing = [parameter for parameter in parameters if parameter not in bound and parameter not in REGION_FIELDS]
+    if missing:
+        raise TypeError(f"CountryData() missing required arguments: {', '.join(map(repr, missing))}")
+    return bound
 
 
-@dataclass
 class CountryData:
-    """Stores comprehensive data about a country"""
-    name: str
-    cost_of_living_index: float  # 0-100, lower is cheaper
-    quality_of_life_index: float  # 0-100, higher is better
-    safety_index: float  # 0-100, higher is safer
-    healthcare_index: float  # 0-100, higher is better
-    climate_score: float  # 0-100, higher is better weather
-    job_market_score: float  # 0-100, higher is better opportunities
-    english_proficiency: float  # 0-100, higher means better English
-    visa_ease: float  # 0-100, higher means easier to get visa
-    tax_friendliness: float  # 0-100, higher means lower taxes
-    internet_speed: float  # Mbps average
-    expat_community_size: str  # Small, Medium, Large
+    """
+    Stores comprehensive data about a country
+    A lightweight view over one row of a CountryStore. Constructing one
+    directly creates a detached row holding only a tuple of its values,
+    ordered like COUNTRY_FIELDS; appending copies the tuple into a store,
+    and modifying or scoring the row moves it into a single-row store
+    """
+    __slots__ = ('_store', '_row')  # Detached rows have no store and keep their values tuple in _row
+    
+    def __init__(self, name: str, *values, **fields):
+        """
+        The remaining fields follow COUNTRY_FIELDS, by position or keyword:
+        one value per METRIC_FIELDS metric, expat_community_size, then the
+        optional region and sub_region, so a new MetricSpec needs no change here
+        """
+        fields = _bind_country_fields(values, fields)
+        metrics = _checked_metrics(name, [fields[metric] for metric in METRIC_FIELDS])
+        expat_label = ExpatCommunitySize.parse(fields['expat_community_size']).label
+        self._store = None
+        self._row = (name, *metrics, expat_label, fields.get('region', ''), fields.get('sub_region', ''))
+    
+    def _attach(self) -> 'CountryStore':
+        """The backing store, first moving a detached row into a single-row store of its own"""
+        if self._store is None:
+            values = self._row
+            store = CountryStore()
+            store.append_row(values[0], values[1:-3], values[-3], values[-2], values[-1])
+            self._store, self._row = store, 0
+        return self._store
+    
+    @classmethod
+    def _view(cls, store: 'CountryStore', row: int) -> 'CountryData':
+        """Create a view over an existing store row without copying"""
+        view = object.__new__(cls)
+        view._store = store
+        view._row = row
+        return view
+    
+    @property
+    def name(self) -> str:
+        if self._store is None:
+            return self._row[0]
+        return self._store.names[self._row]
+    
+    @name.setter
+    def name(self, value: str):
+        store = self._attach()
+        store.set_name(self._row, value)
+    
+    cost_of_living_index = _metric_property('cost_of_living_index')
+    quality_of_life_index = _metric_property('quality_of_life_index')
+    safety_index = _metric_property('safety_index')
+    healthcare_index = _metric_property('healthcare_index')
+    climate_score = _metric_property('climate_score')
+    job_market_score = _metric_property('job_market_score')
+    english_proficiency = _metric_property('english_proficiency')
+    visa_ease = _metric_property('visa_ease')
+    tax_friendliness = _metric_property('tax_friendliness')
+    internet_speed = _metric_property('internet_speed')
+    
+    @property
+    def expat_community_size(self) -> str:
+        if self._store is None:
+            return self._row[-3]
+        return _EXPAT_LABELS[self._store.expat_codes[self._row]]
+    
+    @expat_community_size.setter
+    def expat_community_size(self, value: Union[str, ExpatCommunitySize]):
+        store = self._attach()
+        store.set_expat_community_size(self._row, value)
+    
+    @property
+    def expat_community_level(self) -> ExpatCommunitySize:
+        """Expat community size as an ordered enum instead of a label"""
+        if self._store is None:
+            return ExpatCommunitySize.parse(self._row[-3])
+        return ExpatCommunitySize(self._store.expat_codes[self._row])
+    
+    @property
+    def region(self) -> str:
+        """Broad region such as 'Europe' or 'Asia' ('' when untagged)"""
+        if self._store is None:
+            return self._row[-2]
+        return self._store.region_labels[self._store.region_codes[self._row]]
+    
+    @region.setter
+    def region(self, value: str):
+        store = self._attach()
+        store.set_region(self._row, value)
+    
+    @property
+    def sub_region(self) -> str:
+        """Finer region such as 'Southeast Asia' ('' when untagged)"""
+        if self._store is None:
+            return self._row[-1]
+        return self._store.region_labels[self._store.sub_region_codes[self._row]]
+    
+    @sub_region.setter
+    def sub_region(self, value: str):
+        store = self._attach()
+        store.set_sub_region(self._row, value)
+    
+    def _values(self) -> Tuple:
+        if self._store is None:
+            return self._row
+        return self._store.row_values(self._row)
+    
+    def __eq__(self, other):
+        if not isinstance(other, CountryData):
+            return NotImplemented
+        return self._values() == other._values()
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(COUNTRY_FIELDS, self._values()))
+        return f"CountryData({fields})"
     
     def to_dict(self) -> Dict:
-        return {
-            'name': self.name,
-            'cost_of_living_index': self.cost_of_living_index,
-            'quality_of_life_index': self.quality_of_life_index,
-            'safety_index': self.safety_index,
-            'healthcare_index': self.healthcare_index,
-            'climate_score': self.climate_score,
-            'job_market_score': self.job_market_score,
-            'english_proficiency': self.english_proficiency,
-            'visa_ease': self.visa_ease,
-            'tax_friendliness': self.tax_friendliness,
-            'internet_speed': self.internet_speed,
-            'expat_community_size': self.expat_community_size
+        return dict(zip(COUNTRY_FIELDS, self._values()))
+
+
+class SortedIndex:
+    """Row ids of one metric column ordered by value, for binary-search threshold queries"""
+    __slots__ = ('values', 'rows')
+    
+    def __init__(self, column: array):
+        # Sort with NumPy only when an engine has already imported it
+        if np is not None:
+            order = np.argsort(np.frombuffer(column, dtype=np.float64), kind='stable').astype(np.int64)
+            self.rows = array('q', order.tobytes())
+            self.values = array('d', np.frombuffer(column, dtype=np.float64)[order].tobytes())
+        else:
+            order = sorted(range(len(column)), key=column.__getitem__)
+            self.rows = array('q', order)
+            self.values = array('d', (column[row] for row in order))
+    
+    def position(self, min_value: float) -> int:
+        """Offset of the first entry with value >= min_value"""
+        return bisect_left(self.values, min_value)
+    
+    def _locate(self, value: float, row: int) -> int:
+        """Offset of the (value, row) entry, or where it belongs; equal values stay in row order"""
+        low = bisect_left(self.values, value)
+        high = bisect_right(self.values, value, low)
+        return bisect_left(self.rows, row, low, high)
+    
+    def insert(self, row: int, value: float):
+        """Add an entry for a new row without re-sorting"""
+        position = self._locate(value, row)
+        self.values.insert(position, value)
+        self.rows.insert(position, row)
+    
+    def move(self, row: int, old_value: float, new_value: float):
+        """Reposition a row whose value changed from old_value to new_value"""
+        position = self._locate(old_value, row)
+        del self.values[position]
+        del self.rows[position]
+        self.insert(row, new_value)
+
+
+class _StringTable:
+    """Read-only sequence of strings decoded on demand from a snapshot's string table"""
+    __slots__ = ('_offsets', '_blob')
+    
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string table index out of range")
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+    
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+class CountryStore:
+    """
+    Columnar storage for country data
+    One contiguous float64 array per metric, a name column, a one-byte
+    expat size code column and two-byte region / sub-region codes into a
+    shared label table; indexing or iterating yields CountryData views
+    over the rows. Stores opened from a snapshot read straight from a
+    read-only memory map and copy themselves into private arrays on the
+    first mutation
+    """
+    
+    def __init__(self, countries: Iterable[CountryData] = ()):
+        self.names: List[str] = []
+        self.columns: List[array] = [array('d') for _ in METRIC_FIELDS]
+        self.expat_codes = array('b')  # ExpatCommunitySize codes
+        self.region_labels: List[str] = ['']  # Region and sub-region names; code 0 means untagged
+        self.region_codes = array('H')
+        self.sub_region_codes = array('H')
+        self._region_ids = {'': 0}  # Label -> code
+        self.version = 0  # Bumped on every mutation
+        self.column_versions = [0] * len(METRIC_FIELDS)  # Store version of each metric column's last change
+        self.rows_version = 0  # Store version of the last append or change to a non-metric field
+        self.frozen = False
+        self.dataset_key: Optional[Tuple] = None  # DatasetRegistry key of a shared store, stable across processes
+        self._mmap = None  # Backing memory map for snapshot stores
+        self._metric_block = None  # All metric columns as one (metrics x rows) buffer, snapshots only
+        # Derived data, built on first use and then maintained by every mutation
+        self._matrices = None
+        self._normalized: Dict[int, Tuple[Tuple[int, int], array]] = {}  # Index -> ((rows, column version), scores)
+        self._sorted_indexes: Dict[int, SortedIndex] = {}
+        self._rows_by_name: Optional[Dict[str, int]] = None  # Folded name -> first row with it
+        self._aliases = _DEFAULT_ALIASES  # Folded alias -> country name, copied on first add_alias
+        self._rows_by_region: Optional[Dict[str, array]] = None  # Folded label -> sorted row ids
+        self.deal_breaker_bits: Optional[array] = None  # Per-row uint64, one bit per compiled deal breaker
+        self._deal_breaker_bit: Dict[DealBreaker, int] = {}
+        self._derived_lock = threading.Lock()  # Serializes lazy compilation of deal-breaker bits
+        self._cursors: Optional['CursorRegistry'] = None  # Open rankings, shared by every agent on the store
+        self._result_cache: Optional['RecommendationCache'] = None  # recommend_countries results, shared likewise
+        for country in countries:
+            self.append(country)
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [CountryData._view(self, r) for r in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("country row out of range")
+        return CountryData._view(self, row)
+    
+    def __iter__(self) -> Iterator[CountryData]:
+        for row in range(len(self)):
+            yield CountryData._view(self, row)
+    
+    def append_row(self, name: str, metrics: Iterable[float],
+                   expat_community_size: Union[str, ExpatCommunitySize],
+                   region: str = '', sub_region: str = '') -> int:
+        """Append one row of raw values and return its row id"""
+        # Validate everything before touching the columns so a bad row can't leave them ragged
+        values = _checked_metrics(name, metrics)
+        expat_code = ExpatCommunitySize.parse(expat_community_size)
+        self._ensure_writable()
+        region_code = self._region_code(region)
+        sub_region_code = self._region_code(sub_region)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        self.names.append(name)
+        self.expat_codes.append(expat_code)
+        self.region_codes.append(region_code)
+        self.sub_region_codes.append(sub_region_code)
+        row = len(self.names) - 1
+        
+        self._matrices = None  # Rebuilt at the new size on next use
+        for index, sorted_index in self._sorted_indexes.items():
+            sorted_index.insert(row, values[index])
+        for index, (stamp, scores) in list(self._normalized.items()):
+            spec = METRIC_SPECS[METRIC_FIELDS[index]]
+            if spec.row_local and stamp == (row, self.column_versions[index]):
+                scores.append(spec.normalize(values[index], spec.bounds(())))
+                self._normalized[index] = ((row + 1, stamp[1]), scores)
+        if self._rows_by_name is not None:
+            self._rows_by_name.setdefault(_fold_name(name), row)
+        if self.deal_breaker_bits is not None:
+            self.deal_breaker_bits.append(self._row_deal_breaker_bits(row))
+        if self._rows_by_region is not None:
+            # The new row has the highest id, so appending keeps every list sorted
+            for label in {_fold_name(self.region_labels[region_code]), _fold_name(self.region_labels[sub_region_code])}:
+                if label:
+                    self._rows_by_region.setdefault(label, array('q')).append(row)
+        self.version += 1
+        self.rows_version = self.version
+        return row
+    
+    def append(self, country: CountryData) -> int:
+        """Copy a CountryData row (from any store, or detached) into this store"""
+        source, row = country._store, country._row
+        if source is None:
+            return self.append_row(row[0], row[1:-3], row[-3], row[-2], row[-1])
+        return self.append_row(
+            source.names[row],
+            (column[row] for column in source.columns),
+            source.expat_codes[row],
+            source.region_labels[source.region_codes[row]],
+            source.region_labels[source.sub_region_codes[row]]
+        )
+    
+    def extend(self, countries: Iterable[CountryData]):
+        for country in countries:
+            self.append(country)
+    
+    def extend_rows(self, rows: Iterable[Tuple]):
+        """
+        Append (name, metrics, expat size[, region, sub-region]) rows, consuming
+        the iterable lazily
+        """
+        for name, metrics, expat_community_size, *regions in rows:
+            self.append_row(name, metrics, expat_community_size, *regions)
+    
+    @classmethod
+    def from_file(cls, path: str) -> 'CountryStore':
+        """
+        Build a store from a data file
+        Snapshots (.snap) are memory-mapped with open_snapshot; CSV and JSON
+        Lines files are streamed through iter_country_rows
+        """
+        if os.path.splitext(path)[1].lower() == SNAPSHOT_EXTENSION:
+            return cls.open_snapshot(path)
+        store = cls()
+        store.extend_rows(iter_country_rows(path))
+        return store
+    
+    @classmethod
+    def open_snapshot(cls, path: str) -> 'CountryStore':
+        """
+        Open a snapshot written by write_snapshot without copying it
+        Columns are memoryviews over a read-only mmap, so every process opening
+        the same file shares one page-cache copy and the cost does not grow
+        with the number of rows
+        """
+        import mmap
+        with open(path, 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size < _SNAPSHOT_HEADER.size:
+                raise SchemaError(f"{path}: too short to be a country snapshot")
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        
+        magic, schema_version, metric_count, rows, fields_size, names_size = _SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC:
+            raise SchemaError(f"{path}: not a country snapshot")
+        if schema_version not in _READABLE_SNAPSHOT_VERSIONS:
+            raise SchemaError(f"{path}: snapshot schema version {schema_version}, expected {SNAPSHOT_SCHEMA_VERSION}")
+        offset = _SNAPSHOT_HEADER.size
+        byte_order = 'little'
+        if schema_version >= 3:
+            if len(view) < offset + _SNAPSHOT_BYTE_ORDER.size:
+                raise SchemaError(f"{path}: snapshot is truncated")
+            byte_order = _SNAPSHOT_BYTE_ORDER.unpack_from(view, offset)[0].rstrip(b'\0').decode('ascii', 'replace')
+            offset += _SNAPSHOT_BYTE_ORDER.size
+        if byte_order != sys.byteorder:
+            raise SchemaError(
+                f"{path}: snapshot columns are {byte_order}-endian but this machine is {sys.byteorder}-endian; "
+                "write the snapshot again on this machine"
+            )
+        if len(view) < offset + fields_size:
+            raise SchemaError(f"{path}: snapshot is truncated")
+        fields = str(view[offset:offset + fields_size], 'utf-8').split('\n')
+        if tuple(fields) != METRIC_FIELDS:
+            raise SchemaError(f"{path}: snapshot metric fields {fields} do not match {list(METRIC_FIELDS)}")
+        
+        offset = _align8(offset + fields_size)
+        metrics_end = offset + metric_count * rows * 8
+        offsets_end = metrics_end + (rows + 1) * 8
+        codes_end = offsets_end + rows
+        if len(view) < codes_end + names_size:
+            raise SchemaError(f"{path}: snapshot is truncated")
+        
+        store = cls()
+        store._mmap = mapped
+        store._metric_block = view[offset:metrics_end]
+        store.columns = [
+            view[offset + index * rows * 8:offset + (index + 1) * rows * 8].cast('d')
+            for index in range(metric_count)
+        ]
+        store.names = _StringTable(view[metrics_end:offsets_end].cast('Q'), view[codes_end:codes_end + names_size])
+        store.expat_codes = view[offsets_end:codes_end].cast('b')
+        
+        if schema_version == 1:
+            # Written before regions existed: every row is untagged
+            store.region_codes = array('H', bytes(2 * rows))
+            store.sub_region_codes = array('H', bytes(2 * rows))
+            return store
+        offset = _align8(codes_end + names_size)
+        if len(view) < offset + _SNAPSHOT_REGIONS.size:
+            raise SchemaError(f"{path}: snapshot is truncated")
+        labels_size, = _SNAPSHOT_REGIONS.unpack_from(view, offset)
+        regions_start = offset + _SNAPSHOT_REGIONS.size
+        regions_end = regions_start + 4 * rows
+        if len(view) < regions_end + labels_size:
+            raise SchemaError(f"{path}: snapshot is truncated")
+        store.region_codes = view[regions_start:regions_start + 2 * rows].cast('H')
+        store.sub_region_codes = view[regions_start + 2 * rows:regions_end].cast('H')
+        store.region_labels = str(view[regions_end:regions_end + labels_size], 'utf-8').split('\n')
+        store._region_ids = {label: code for code, label in enumerate(store.region_labels)}
+        return store
+    
+    def write_snapshot(self, path: str):
+        """
+        Write the store as a binary snapshot for open_snapshot
+        Layout: header (magic, schema version, counts, native byte order,
+        metric field names), then 8-byte aligned float64 columns, name
+        offsets, expat codes and the UTF-8 name table, then (8-byte aligned)
+        the region label-table size, region and sub-region codes and the label
+        table. The file is written atomically
+        """
+        rows = len(self)
+        fields = '\n'.join(METRIC_FIELDS).encode('utf-8')
+        labels = '\n'.join(self.region_labels).encode('utf-8')
+        encoded_names = [name.encode('utf-8') for name in self.names]
+        offsets = array('Q', [0])
+        for encoded in encoded_names:
+            offsets.append(offsets[-1] + len(encoded))
+        
+        temporary = f"{path}.tmp{os.getpid()}"
+        with open(temporary, 'wb') as handle:
+            def pad():
+                handle.write(b'\0' * (_align8(handle.tell()) - handle.tell()))
+            
+            handle.write(_SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_SCHEMA_VERSION, len(METRIC_FIELDS), rows, len(fields), offsets[-1]
+            ))
+            handle.write(_SNAPSHOT_BYTE_ORDER.pack(sys.byteorder.encode('ascii')))
+            handle.write(fields)
+            pad()
+            for column in self.columns:
+                handle.write(column)
+            handle.write(offsets)
+            handle.write(self.expat_codes)
+            for encoded in encoded_names:
+                handle.write(encoded)
+            pad()
+            handle.write(_SNAPSHOT_REGIONS.pack(len(labels)))
+            handle.write(self.region_codes)
+            handle.write(self.sub_region_codes)
+            handle.write(labels)
+        os.replace(temporary, path)
+    
+    def freeze(self) -> 'CountryStore':
+        """Make the store immutable so it can be shared between agents"""
+        self.frozen = True
+        return self
+    
+    def copy(self) -> 'CountryStore':
+        """Return a private, mutable copy of the store"""
+        store = CountryStore()
+        store.names = list(self.names)
+        store.columns = [array('d', column.tobytes()) for column in self.columns]
+        store.expat_codes = array('b', self.expat_codes.tobytes())
+        store.region_labels = list(self.region_labels)
+        store.region_codes = array('H', self.region_codes.tobytes())
+        store.sub_region_codes = array('H', self.sub_region_codes.tobytes())
+        store._region_ids = dict(self._region_ids)
+        store._aliases = self._aliases if self._aliases is _DEFAULT_ALIASES else dict(self._aliases)
+        return store
+    
+    def _ensure_writable(self):
+        """Copy snapshot-backed columns into private arrays before the first mutation"""
+        if self.frozen:
+            raise TypeError(
+                "This country store is shared and read-only; "
+                "use agent.countries = agent.countries.copy() to get a private copy"
+            )
+        if self._mmap is None:
+            return
+        self.columns = [array('d', column.tobytes()) for column in self.columns]
+        self.names = list(self.names)
+        self.expat_codes = array('b', self.expat_codes.tobytes())
+        self.region_codes = array('H', self.region_codes.tobytes())
+        self.sub_region_codes = array('H', self.sub_region_codes.tobytes())
+        self._metric_block = None
+        self._mmap = None
+        self._matrices = None  # They were read-only views of the map
+    
+    def set_value(self, row: int, index: int, value: float):
+        """Overwrite one metric cell in place"""
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(f"{METRIC_FIELDS[index]} must be a finite number, got {value!r}")
+        self._ensure_writable()
+        old_value = self.columns[index][row]
+        self.columns[index][row] = value
+        
+        # Patch derived data in place instead of rebuilding it; dataset-relative
+        # normalizations have to rescale the whole column
+        spec = METRIC_SPECS[METRIC_FIELDS[index]]
+        if self._matrices is not None:
+            raw, normalized = self._matrices
+            raw[index, row] = value
+            if spec.row_local:
+                normalized[index, row] = spec.normalize(value, spec.bounds(()))
+            else:
+                normalized[index] = spec.normalize_array(raw[index])
+        if index in self._sorted_indexes:
+            self._sorted_indexes[index].move(row, old_value, value)
+        if self.deal_breaker_bits is not None:
+            self.deal_breaker_bits[row] = self._row_deal_breaker_bits(row)
+        self.version += 1
+        stamp = (len(self), self.column_versions[index])
+        self.column_versions[index] = self.version
+        if spec.row_local and index in self._normalized and self._normalized[index][0] == stamp:
+            scores = self._normalized[index][1]
+            scores[row] = spec.normalize(value, spec.bounds(()))
+            self._normalized[index] = ((len(self), self.version), scores)
+    
+    def set_name(self, row: int, name: str):
+        self._ensure_writable()
+        self.names[row] = name
+        self._rows_by_name = None
+        self.version += 1
+        self.rows_version = self.version
+    
+    def set_expat_community_size(self, row: int, value: Union[str, ExpatCommunitySize]):
+        code = ExpatCommunitySize.parse(value)
+        self._ensure_writable()
+        self.expat_codes[row] = code
+        if self.deal_breaker_bits is not None:
+            self.deal_breaker_bits[row] = self._row_deal_breaker_bits(row)
+        self.version += 1
+        self.rows_version = self.version
+    
+    def set_region(self, row: int, region: str):
+        self._ensure_writable()
+        self.region_codes[row] = self._region_code(region)
+        self._regions_changed()
+    
+    def set_sub_region(self, row: int, sub_region: str):
+        self._ensure_writable()
+        self.sub_region_codes[row] = self._region_code(sub_region)
+        self._regions_changed()
+    
+    def _regions_changed(self):
+        self._rows_by_region = None  # Rebuilt on next use
+        self.version += 1
+        self.rows_version = self.version
+    
+    def _region_code(self, label: str) -> int:
+        """Code for a region label, adding it to the label table if it is new"""
+        if not isinstance(label, str):
+            raise TypeError(f"Region names must be strings, got {label!r}")
+        label = label.strip()
+        if '\n' in label:
+            raise ValueError(f"Region names must be a single line, got {label!r}")
+        code = self._region_ids.get(label)
+        if code is None:
+            code = len(self.region_labels)
+            if code > 0xFFFF:
+                raise ValueError("Too many distinct region names for two-byte codes")
+            self.region_labels.append(label)
+            self._region_ids[label] = code
+        return code
+    
+    def region_rows(self, regions: Iterable[str]) -> array:
+        """
+        Sorted ids of rows whose region or sub-region is one of regions, ignoring case
+        Answered from an inverted label -> rows index, built on first use
+        """
+        if self._rows_by_region is None:
+            index = {}
+            labels = [_fold_name(label) for label in self.region_labels]
+            for row, (region_code, sub_region_code) in enumerate(zip(self.region_codes, self.sub_region_codes)):
+                for label in {labels[region_code], labels[sub_region_code]}:
+                    if label:
+                        index.setdefault(label, array('q')).append(row)
+            self._rows_by_region = index
+        matches = [self._rows_by_region[key] for key in {_fold_name(region) for region in regions}
+                   if key in self._rows_by_region]
+        if len(matches) == 1:
+            return matches[0][:]
+        return array('q', sorted(set().union(*matches)))
+    
+    def deal_breaker_mask(self, names: Iterable[str]) -> int:
+        """
+        Bit mask over deal_breaker_bits for the named DEAL_BREAKERS
+        A predicate is evaluated for every row once, the first time any
+        criteria name it (under a lock, so agents sharing a frozen store can
+        race for it), and the bits are then kept current by mutations; a row
+        is excluded when bits & mask is non-zero
+        """
+        mask = 0
+        for name in names:
+            breaker = DEAL_BREAKERS[name]
+            bit = self._deal_breaker_bit.get(breaker)
+            if bit is None:
+                bit = self._compile_deal_breaker(breaker)
+            mask |= bit
+        return mask
+    
+    def _compile_deal_breaker(self, breaker: DealBreaker) -> int:
+        with self._derived_lock:
+            # Another thread may have compiled it while this one waited
+            bit = self._deal_breaker_bit.get(breaker)
+            if bit is not None:
+                return bit
+            if len(self._deal_breaker_bit) == 64:
+                raise ValueError("A store can compile at most 64 distinct deal breakers")
+            bit = 1 << len(self._deal_breaker_bit)
+            bits = self.deal_breaker_bits
+            if bits is None:
+                bits = array('Q', bytes(8 * len(self)))
+            values = self._field_values(breaker.field)
+            if np is not None and len(bits):
+                # Readers only test published bits, so setting this one in place is safe
+                values = np.frombuffer(values, dtype=np.int8 if breaker.field == 'expat_community_size' else np.float64)
+                excluded = np.zeros(len(values), dtype=bool)
+                if breaker.below is not None:
+                    excluded |= values < breaker.below
+                if breaker.above is not None:
+                    excluded |= values > breaker.above
+                np.frombuffer(bits, dtype=np.uint64)[excluded] |= np.uint64(bit)
+            else:
+                for row, value in enumerate(values):
+                    if breaker.excludes(value):
+                        bits[row] |= bit
+            # Publish the bits before the bit number, so readers never see a mask over unset bits
+            self.deal_breaker_bits = bits
+            self._deal_breaker_bit[breaker] = bit
+            return bit
+    
+    def _row_deal_breaker_bits(self, row: int) -> int:
+        """Evaluate every compiled deal breaker for one row"""
+        row_bits = 0
+        for breaker, bit in self._deal_breaker_bit.items():
+            if breaker.excludes(self._field_values(breaker.field)[row]):
+                row_bits |= bit
+        return row_bits
+    
+    def _field_values(self, field_name: str):
+        if field_name == 'expat_community_size':
+            return self.expat_codes
+        return self.columns[METRIC_INDEX[field_name]]
+    
+    def region_codes_for(self, regions: Iterable[str], untagged: bool = False) -> frozenset:
+        """
+        Label codes matching any of regions, ignoring case, for probing the code columns
+        Code 0 (untagged rows) only matches '' when untagged is true, as in
+        requirement expressions; preferred_regions never selects untagged rows
+        """
+        keys = {_fold_name(region) for region in regions}
+        return frozenset(
+            code for code, label in enumerate(self.region_labels) if (code or untagged) and _fold_name(label) in keys
+        )
+    
+    def changed_since(self, version: int, indexes: Iterable[int]) -> bool:
+        """Whether rows, names, expat sizes or any of the given metric columns changed after version"""
+        return self.rows_version > version or any(self.column_versions[index] > version for index in indexes)
+    
+    def find_row(self, name: str) -> Optional[int]:
+        """
+        Row id of a country by name or alias, ignoring case, or None
+        Names win over aliases; with duplicate names the first row is returned
+        """
+        rows_by_name = self._rows_by_name
+        if rows_by_name is None:
+            # Built locally and published whole: threads sharing the store never see it half-filled
+            rows_by_name = {}
+            for row, country_name in enumerate(self.names):
+                rows_by_name.setdefault(_fold_name(country_name), row)
+            self._rows_by_name = rows_by_name
+        key = _fold_name(name)
+        row = rows_by_name.get(key)
+        if row is None and key in self._aliases:
+            row = rows_by_name.get(_fold_name(self._aliases[key]))
+        return row
+    
+    def row_of(self, name: str) -> int:
+        """Like find_row, but raises KeyError for unknown names"""
+        row = self.find_row(name)
+        if row is None:
+            raise KeyError(f"No country named {name!r}")
+        return row
+    
+    def add_alias(self, alias: str, name: str):
+        """Make lookups for alias resolve to the country called name"""
+        self._ensure_writable()
+        if self._aliases is _DEFAULT_ALIASES:
+            self._aliases = dict(_DEFAULT_ALIASES)
+        self._aliases[_fold_name(alias)] = name
+    
+    def update_country(self, name: str, **fields) -> CountryData:
+        """
+        Patch fields of the named country in place and return its view
+        All values are validated before anything is written; fields already
+        holding the new value are skipped so their versions do not move
+        """
+        row = self.row_of(name)
+        self._update_row(row, _coerce_fields(fields, name))
+        return self[row]
+    
+    def upsert_many(self, rows: Iterable[Union[CountryData, Dict]]) -> Tuple[int, int]:
+        """
+        Update existing countries and append new ones, matched like find_row
+        rows are CountryData or mappings with a 'name' key: updates may carry
+        any subset of fields (the name itself is only the match key), new
+        countries need all of them. Every row is validated before the store
+        changes. Returns (updated, inserted)
+        """
+        changes = []
+        new_names = set()
+        for position, record in enumerate(rows, start=1):
+            if isinstance(record, CountryData):
+                record = record.to_dict()
+            name = record.get('name')
+            if not isinstance(name, str) or not name.strip():
+                raise SchemaError(f"upsert_many:{position}: name must be a non-empty string, got {name!r}")
+            if _fold_name(name) in new_names or self.find_row(name) is not None:
+                fields = {key: value for key, value in record.items() if key != 'name'}
+                changes.append((name, _coerce_fields(fields, f"upsert_many:{position}")))
+            else:
+                _check_fields(record, 'upsert_many', position)
+                values = tuple(record.get(key) for key in COUNTRY_FIELDS)
+                changes.append((None, _validate_row(values, 'upsert_many', position)))
+                new_names.add(_fold_name(name))
+        
+        updated = inserted = 0
+        for name, values in changes:
+            if name is None:
+                self.append_row(*values)
+                inserted += 1
+            else:
+                self._update_row(self.find_row(name), values)
+                updated += 1
+        return updated, inserted
+    
+    def _update_row(self, row: int, values: Dict):
+        for field_name, value in values.items():
+            if field_name == 'name':
+                if self.names[row] != value:
+                    self.set_name(row, value)
+            elif field_name == 'expat_community_size':
+                if self.expat_codes[row] != value:
+                    self.set_expat_community_size(row, value)
+            elif field_name == 'region':
+                if self.region_labels[self.region_codes[row]] != value:
+                    self.set_region(row, value)
+            elif field_name == 'sub_region':
+                if self.region_labels[self.sub_region_codes[row]] != value:
+                    self.set_sub_region(row, value)
+            elif self.columns[METRIC_INDEX[field_name]][row] != value:
+                self.set_value(row, METRIC_INDEX[field_name], value)
+    
+    def numpy_matrices(self) -> Tuple['np.ndarray', 'np.ndarray']:
+        """
+        Return (raw, normalized) metric matrices shaped (metrics, rows)
+        The normalized matrix holds every column as scored by its MetricSpec;
+        both are built on first use, patched in place by set_value and rebuilt
+        after rows are appended
+        """
+        if self._matrices is None:
+            _load_numpy()
+            if self._metric_block is not None:
+                # Snapshot columns are already one contiguous block: view it without copying
+                raw = np.frombuffer(self._metric_block, dtype=np.float64).reshape(len(METRIC_FIELDS), len(self))
+            else:
+                raw = np.vstack([np.frombuffer(column, dtype=np.float64) for column in self.columns])
+            normalized = np.vstack([
+                METRIC_SPECS[name].normalize_array(raw[index]) for index, name in enumerate(METRIC_FIELDS)
+            ])
+            self._matrices = (raw, normalized)
+        return self._matrices
+    
+    def normalized_column(self, index: int) -> array:
+        """
+        A metric column as scored by its MetricSpec, for the pure-Python engine
+        Computed once per column version and kept up to date by appends and
+        set_value where the normalization allows it
+        """
+        stamp = (len(self), self.column_versions[index])
+        cached = self._normalized.get(index)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, METRIC_SPECS[METRIC_FIELDS[index]].normalize_column(self.columns[index]))
+            self._normalized[index] = cached
+        return cached[1]
+    
+    def normalized_value(self, index: int, row: int) -> float:
+        """
+        One cell of normalized_column, for breakdowns of a few rows
+        Read from whichever normalized copy the scoring engine already built;
+        row-local normalizations are computed from the single raw value, so
+        neither engine has to normalize a whole column for one cell
+        """
+        column = self._current_normalized(index)
+        if column is not None:
+            return column[row]
+        if self._matrices is not None:
+            return float(self._matrices[1][index, row])
+        spec = METRIC_SPECS[METRIC_FIELDS[index]]
+        if spec.row_local:
+            return spec.normalize(self.columns[index][row], spec.bounds(()))
+        return self.normalized_column(index)[row]  # Dataset-relative: needs the column's statistics
+    
+    def _current_normalized(self, index: int) -> Optional[array]:
+        """The cached normalized_column if it is up to date, without building it"""
+        cached = self._normalized.get(index)
+        if cached is not None and cached[0] == (len(self), self.column_versions[index]):
+            return cached[1]
+        return None
+    
+    def result_cache(self, maxsize: int = 128) -> 'RecommendationCache':
+        """The recommend_countries LRU cache for this store, holding at least maxsize entries"""
+        cache = self._result_cache
+        if cache is None:
+            with self._derived_lock:
+                if self._result_cache is None:
+                    self._result_cache = RecommendationCache(maxsize)
+                cache = self._result_cache
+        cache.grow(maxsize)
+        return cache
+    
+    def cursor_registry(self) -> 'CursorRegistry':
+        """Open RankedCursors over this store; agents sharing a dataset share its cursors"""
+        registry = self._cursors
+        if registry is None:
+            with self._derived_lock:
+                if self._cursors is None:
+                    self._cursors = CursorRegistry()
+                registry = self._cursors
+        return registry
+    
+    def sorted_index(self, index: int) -> SortedIndex:
+        """Return the value-ordered index for a metric column, built on first use and kept up to date"""
+        if index not in self._sorted_indexes:
+            self._sorted_indexes[index] = SortedIndex(self.columns[index])
+        return self._sorted_indexes[index]
+    
+    def row_values(self, row: int) -> Tuple:
+        """Return a row as a tuple ordered like COUNTRY_FIELDS"""
+        return (
+            self.names[row], *[column[row] for column in self.columns], _EXPAT_LABELS[self.expat_codes[row]],
+            self.region_labels[self.region_codes[row]], self.region_labels[self.sub_region_codes[row]]
+        )
+
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'countries.csv')
+
+# Binary snapshot format (see CountryStore.write_snapshot). Headers are little-endian;
+# columns are mapped without conversion, so they are in the writer's native byte order,
+# which version 3 records right after the header
+SNAPSHOT_EXTENSION = '.snap'
+SNAPSHOT_MAGIC = b'CRSNAP\x00\x00'
+SNAPSHOT_SCHEMA_VERSION = 3
+_READABLE_SNAPSHOT_VERSIONS = (1, 2, 3)  # Version 1 predates regions, version 2 the byte-order field
+# magic, schema version, metric count, row count, field-name bytes, name-table bytes
+_SNAPSHOT_HEADER = struct.Struct('<8sIIQQQ')
+# sys.byteorder of the writer, NUL-padded; versions 1 and 2 were only ever written little-endian
+_SNAPSHOT_BYTE_ORDER = struct.Struct('<8s')
+# region label-table bytes
+_SNAPSHOT_REGIONS = struct.Struct('<Q')
+
+
+def _align8(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+_COUNTRY_FIELD_SET = frozenset(COUNTRY_FIELDS)
+_REQUIRED_FIELDS = tuple(name for name in COUNTRY_FIELDS if name not in REGION_FIELDS)
+_EXPAT_POSITION = COUNTRY_FIELDS.index('expat_community_size')
+
+
+class SchemaError(ValueError):
+    """Raised when a country data file does not match the CountryData fields"""
+
+
+def _validate_row(values: Tuple, source: str, line: int) -> Tuple[str, Tuple[float, ...], ExpatCommunitySize, str, str]:
+    """Check one row of raw values (ordered like COUNTRY_FIELDS) and convert it for CountryStore"""
+    name = values[0]
+    if not isinstance(name, str) or not name.strip():
+        raise SchemaError(f"{source}:{line}: name must be a non-empty string, got {name!r}")
+    
+    metrics = [
+        _coerce_metric(field_name, value, f"{source}:{line}")
+        for field_name, value in zip(METRIC_FIELDS, values[1:_EXPAT_POSITION])
+    ]
+    
+    try:
+        expat_community_size = ExpatCommunitySize.parse(values[_EXPAT_POSITION])
+    except ValueError as error:
+        raise SchemaError(f"{source}:{line}: {error}") from None
+    region, sub_region = (
+        _coerce_region(field_name, value, f"{source}:{line}")
+        for field_name, value in zip(REGION_FIELDS, values[_EXPAT_POSITION + 1:])
+    )
+    return name.strip(), tuple(metrics), expat_community_size, region, sub_region
+
+
+def _coerce_metric(field_name: str, value, context: str) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise SchemaError(f"{context}: {field_name} must be a number, got {value!r}") from None
+    if not math.isfinite(number):
+        raise SchemaError(f"{context}: {field_name} must be finite, got {value!r}")
+    return number
+
+
+def _coerce_region(field_name: str, value, context: str) -> str:
+    if value is None:
+        return ''
+    if not isinstance(value, str) or '\n' in value:
+        raise SchemaError(f"{context}: {field_name} must be a single-line string, got {value!r}")
+    return value.strip()
+
+
+def _coerce_fields(fields: Dict, context: str) -> Dict:
+    """Check a partial set of CountryData fields, converting metrics to floats and expat sizes to codes"""
+    unknown = sorted(set(fields) - _COUNTRY_FIELD_SET)
+    if unknown:
+        raise SchemaError(f"{context}: unknown fields {', '.join(unknown)}")
+    values = {}
+    for field_name, value in fields.items():
+        if field_name == 'name':
+            if not isinstance(value, str) or not value.strip():
+                raise SchemaError(f"{context}: name must be a non-empty string, got {value!r}")
+            values[field_name] = value.strip()
+        elif field_name == 'expat_community_size':
+            try:
+                values[field_name] = ExpatCommunitySize.parse(value)
+            except ValueError as error:
+                raise SchemaError(f"{context}: {error}") from None
+        elif field_name in REGION_FIELDS:
+            values[field_name] = _coerce_region(field_name, value, context)
+        else:
+            values[field_name] = _coerce_metric(field_name, value, context)
+    return values
+
+
+def _check_fields(fields: Iterable[str], source: str, line: int):
+    """Every required CountryData field must be present; region fields are optional"""
+    fields = set(fields)
+    missing = [name for name in _REQUIRED_FIELDS if name not in fields]
+    unknown = sorted(fields - _COUNTRY_FIELD_SET)
+    if missing or unknown:
+        problems = []
+        if missing:
+            problems.append(f"missing {', '.join(missing)}")
+        if unknown:
+            problems.append(f"unknown {', '.join(unknown)}")
+        raise SchemaError(f"{source}:{line}: fields do not match CountryData ({'; '.join(problems)})")
+
+
+def iter_csv_rows(path: str) -> Iterator[Tuple[str, Tuple[float, ...], ExpatCommunitySize, str, str]]:
+    """Stream validated rows from a CSV file whose header names the CountryData fields"""
+    with open(path, newline='', encoding='utf-8') as handle:
+        import csv  # Deferred: only CSV loads pay for csv (and re)
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [column.strip() for column in header]
+        _check_fields(header, path, 1)
+        positions = [header.index(name) if name in header else None for name in COUNTRY_FIELDS]
+        
+        for line, values in enumerate(reader, start=2):
+            if not values:
+                continue
+            if len(values) != len(header):
+                raise SchemaError(f"{path}:{line}: expected {len(header)} columns, got {len(values)}")
+            yield _validate_row(
+                tuple('' if position is None else values[position] for position in positions), path, line
+            )
+
+
+def iter_jsonl_rows(path: str) -> Iterator[Tuple[str, Tuple[float, ...], ExpatCommunitySize, str, str]]:
+    """Stream validated rows from a JSON Lines file with one CountryData object per line"""
+    import json
+    with open(path, encoding='utf-8') as handle:
+        for line, text in enumerate(handle, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as error:
+                raise SchemaError(f"{path}:{line}: invalid JSON ({error})") from None
+            if not isinstance(record, dict):
+                raise SchemaError(f"{path}:{line}: expected a JSON object")
+            if record.keys() != _COUNTRY_FIELD_SET:
+                _check_fields(record, path, line)
+            yield _validate_row(tuple(record.get(name) for name in COUNTRY_FIELDS), path, line)
+
+
+def iter_country_rows(path: str) -> Iterator[Tuple[str, Tuple[float, ...], ExpatCommunitySize, str, str]]:
+    """
+    Stream validated (name, metrics, expat size) rows from a data file
+    .csv files are read with iter_csv_rows; .jsonl/.ndjson with iter_jsonl_rows
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return iter_csv_rows(path)
+    if extension in ('.jsonl', '.ndjson'):
+        return iter_jsonl_rows(path)
+    raise ValueError(f"Unsupported country data format {extension!r}; use .csv, .jsonl or .ndjson")
+
+
+# JSON encoding templates: each row is one %-format instead of an intermediate dict
+_EXPAT_JSON = tuple(f'"{label}"' for label in _EXPAT_LABELS)
+_COUNTRY_JSON_TEMPLATE = (
+    '{"name":%s,' + ''.join(f'"{name}":%r,' for name in METRIC_FIELDS) +
+    '"expat_community_size":%s,"region":%s,"sub_region":%s}'
+)
+
+
+def _country_row_groups(countries: Iterable[CountryData]) -> Iterator[Tuple['CountryStore', List[int]]]:
+    """Group consecutive views by their backing store so columns can be read in bulk"""
+    if isinstance(countries, CountryStore):
+        yield countries, range(len(countries))
+        return
+    if isinstance(countries, RecommendationSet):
+        yield countries._store, countries.row_ids
+        return
+    store, rows, scratch = None, [], False
+    for country in countries:
+        # Runs of detached rows are copied into one scratch store; the rows themselves stay detached
+        detached = country._store is None
+        if detached != scratch or (not detached and country._store is not store):
+            if rows:
+                yield store, rows
+            store, rows, scratch = (CountryStore() if detached else country._store), [], detached
+        rows.append(store.append(country) if detached else country._row)
+    if rows:
+        yield store, rows
+
+
+def _country_columns(countries: Iterable[CountryData]) -> Tuple[List[str], List[List[float]], List[int], List[list]]:
+    """Gather names, metric columns, expat codes and region / sub-region labels for a sequence of views"""
+    names, columns, codes, regions = [], [[] for _ in METRIC_FIELDS], [], [[], []]
+    for store, rows in _country_row_groups(countries):
+        names.extend(map(store.names.__getitem__, rows))
+        for target, column in zip(columns, store.columns):
+            target.extend(map(column.__getitem__, rows))
+        codes.extend(map(store.expat_codes.__getitem__, rows))
+        for target, region_codes in zip(regions, (store.region_codes, store.sub_region_codes)):
+            target.extend(map(store.region_labels.__getitem__, map(region_codes.__getitem__, rows)))
+    return names, columns, codes, regions
+
+
+def _encode_country_rows(countries: Iterable[CountryData]) -> Iterator[str]:
+    """Yield one JSON object string per country, read straight from the columns"""
+    from json.encoder import encode_basestring_ascii as encode_name
+    for store, rows in _country_row_groups(countries):
+        labels = [encode_name(label) for label in store.region_labels]
+        yield from map(_COUNTRY_JSON_TEMPLATE.__mod__, zip(
+            map(encode_name, map(store.names.__getitem__, rows)),
+            *(map(column.__getitem__, rows) for column in store.columns),
+            map(_EXPAT_JSON.__getitem__, map(store.expat_codes.__getitem__, rows)),
+            map(labels.__getitem__, map(store.region_codes.__getitem__, rows)),
+            map(labels.__getitem__, map(store.sub_region_codes.__getitem__, rows))
+        ))
+
+
+def _columnar_countries(countries: Iterable[CountryData]) -> Dict[str, list]:
+    names, columns, codes, regions = _country_columns(countries)
+    layout = {'name': names}
+    layout.update(zip(METRIC_FIELDS, columns))
+    layout['expat_community_size'] = list(map(_EXPAT_LABELS.__getitem__, codes))
+    layout.update(zip(REGION_FIELDS, regions))
+    return layout
+
+
+def _dumps_layout(layout: Dict) -> str:
+    """Compact JSON for a columnar layout, with orjson when it is installed"""
+    if _load_orjson() is not None:
+        return orjson.dumps(layout).decode()
+    import json
+    return json.dumps(layout, separators=(',', ':'))
+
+
+def dumps_countries(countries: Iterable[CountryData], columnar: bool = False) -> str:
+    """
+    Serialize many countries to compact JSON in one pass
+    The default layout is a list of to_dict()-shaped objects; columnar=True
+    emits one array per field instead. Uses orjson for the columnar layout
+    when it is installed
+    """
+    if columnar:
+        layout = _columnar_countries(countries)
+        return _dumps_layout(layout)
+    return '[' + ','.join(_encode_country_rows(countries)) + ']'
+
+
+def dumps_recommendations(recommendations: Iterable[Tuple[CountryData, float, Dict]], columnar: bool = False) -> str:
+    """
+    Serialize recommend_countries results to compact JSON in one pass
+    Rows become {"country": {...}, "score": ..., "breakdown": {...}}; with
+    columnar=True the countries, scores and per-criterion breakdowns are each
+    emitted as parallel arrays
+    """
+    if isinstance(recommendations, RecommendationSet):
+        return _dumps_recommendation_set(recommendations, columnar)
+    recommendations = list(recommendations)
+    countries = [country for country, _, _ in recommendations]
+    scores = [float(score) for _, score, _ in recommendations]
+    if columnar:
+        criteria = list(dict.fromkeys(criterion for _, _, breakdown in recommendations for criterion in breakdown))
+        breakdown_columns = {
+            criterion: [breakdown.get(criterion) for _, _, breakdown in recommendations] for criterion in criteria
         }
+        layout = {'country': _columnar_countries(countries), 'score': scores, 'breakdown': breakdown_columns}
+        return _dumps_layout(layout)
+    return '[' + ','.join(
+        '{"country":%s,"score":%r,"breakdown":{%s}}' % (
+            country_json, score, ','.join('"%s":%r' % item for item in breakdown.items())
+        )
+        for country_json, score, (_, _, breakdown) in zip(_encode_country_rows(countries), scores, recommendations)
+    ) + ']'
+
+
+def _dumps_recommendation_set(results: 'RecommendationSet', columnar: bool) -> str:
+    """dumps_recommendations straight from a RecommendationSet's row ids, scores and breakdowns() arrays"""
+    criteria = results.criteria_names if len(results) else ()
+    width = len(criteria)
+    weighted = results.breakdowns()
+    scores = results.scores.tolist()
+    if columnar:
+        breakdown_columns = {criterion: weighted[index::width].tolist() for index, criterion in enumerate(criteria)}
+        layout = {'country': _columnar_countries(results), 'score': scores, 'breakdown': breakdown_columns}
+        return _dumps_layout(layout)
+    item_template = ','.join('"%s":%%r' % criterion for criterion in criteria)
+    return '[' + ','.join(
+        '{"country":%s,"score":%r,"breakdown":{%s}}' % (
+            country_json, score, item_template % tuple(weighted[position * width:(position + 1) * width])
+        )
+        for position, (country_json, score) in enumerate(zip(_encode_country_rows(results), scores))
+    ) + ']'
+
+
+class DatasetRegistry:
+    """
+    Process-wide cache of immutable country stores keyed by (source, version)
+    Agents acquire a shared, frozen store instead of loading their own, so
+    creating an agent costs a dictionary lookup. Reference counts track which
+    datasets are in use; unused ones stay cached until purge() is called
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stores: Dict[Tuple, CountryStore] = {}
+        self._references: Dict[Tuple, int] = {}
+    
+    @staticmethod
+    def key(source: str, version=None) -> Tuple:
+        """Registry key for a data file; the version defaults to the file's mtime and size"""
+        path = os.path.abspath(source)
+        if version is None:
+            status = os.stat(path)
+            version = (status.st_mtime_ns, status.st_size)
+        return path, version
+    
+    def acquire(self, source: str, version=None) -> Tuple[Tuple, CountryStore]:
+        """Return (key, store) for a data file, loading it on first use, and take a reference"""
+        key = self.key(source, version)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = CountryStore.from_file(source).freeze()
+                store.dataset_key = key
+                self._stores[key] = store
+            self._references[key] = self._references.get(key, 0) + 1
+        return key, store
+    
+    def release(self, key: Tuple):
+        """Drop a reference taken by acquire"""
+        with self._lock:
+            if self._references.get(key, 0) > 0:
+                self._references[key] -= 1
+    
+    def references(self, key: Tuple) -> int:
+        return self._references.get(key, 0)
+    
+    def purge(self) -> int:
+        """Forget datasets no agent references any more; returns how many were dropped"""
+        with self._lock:
+            unused = [key for key in self._stores if not self._references.get(key)]
+            for key in unused:
+                del self._stores[key]
+                self._references.pop(key, None)
+        return len(unused)
+    
+    def __len__(self) -> int:
+        return len(self._stores)
+
+
+# Shared by every CountryRelocationAgent in the process
+DATASETS = DatasetRegistry()
+
+
+class RequirementSyntaxError(ValueError):
+    """A UserCriteria.requirements expression that cannot be parsed"""
+
+
+# Requirement expressions, e.g.
+#   "cost_of_living_index <= 50 and 60 <= safety_index < 90
+#    and (expat_community_size in (Medium, Large) or region == 'Europe')"
+# parse into nested tuples, hashable so they can sit in CompiledCriteria:
+#   ('and' | 'or', child, child, ...), ('not', child),
+#   ('cmp', column, operator, value) and ('in', column, frozenset of values)
+# where column is a metric index, 'expat_community_size', 'region' or 'sub_region'
+_COMPARISONS = ('<=', '>=', '==', '!=', '<', '>')
+_FLIPPED_COMPARISONS = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!='}
+_EXPRESSION_KEYWORDS = ('and', 'or', 'not', 'in')
+_EXPRESSION_DELIMITERS = '(),\'"<>=!'
+
+
+def _tokenize_requirements(text: str) -> List[Tuple[str, object, int]]:
+    """Split an expression into (kind, value, offset) tokens"""
+    tokens = []
+    position = 0
+    while position < len(text):
+        char = text[position]
+        if char.isspace():
+            position += 1
+        elif char in '(),':
+            tokens.append((char, char, position))
+            position += 1
+        elif char in '\'"':
+            end = text.find(char, position + 1)
+            if end < 0:
+                raise RequirementSyntaxError(f"Unterminated string at offset {position}")
+            tokens.append(('string', text[position + 1:end], position))
+            position = end + 1
+        elif char in '<>=!':
+            comparison = next((op for op in _COMPARISONS if text.startswith(op, position)), None)
+            if comparison is None:
+                raise RequirementSyntaxError(f"Unknown operator at offset {position}")
+            tokens.append(('op', comparison, position))
+            position += len(comparison)
+        else:
+            start = position
+            while (position < len(text) and not text[position].isspace()
+                   and text[position] not in _EXPRESSION_DELIMITERS):
+                position += 1
+            word = text[start:position]
+            if word in _EXPRESSION_KEYWORDS:
+                tokens.append((word, word, start))
+                continue
+            try:
+                tokens.append(('number', float(word), start))
+            except ValueError:
+                tokens.append(('word', word, start))
+    return tokens
+
+
+class _RequirementParser:
+    """Recursive-descent parser: or > and > not > comparison, with Python-style chained comparisons"""
+    
+    def __init__(self, text: str):
+        self.tokens = _tokenize_requirements(text)
+        self.position = 0
+    
+    def parse(self) -> tuple:
+        if not self.tokens:
+            raise RequirementSyntaxError("Empty requirements expression")
+        node = self._or()
+        if self.position < len(self.tokens):
+            self._fail("Unexpected")
+        return node
+    
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+    
+    def _next(self) -> Tuple[str, object, int]:
+        if self.position >= len(self.tokens):
+            raise RequirementSyntaxError("Unexpected end of requirements expression")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+    
+    def _fail(self, message: str):
+        _, value, offset = self.tokens[self.position]
+        raise RequirementSyntaxError(f"{message} {value!r} at offset {offset}")
+    
+    def _expect(self, kind: str):
+        if self._peek() != kind:
+            if self.position >= len(self.tokens):
+                raise RequirementSyntaxError(f"Expected {kind!r} at end of requirements expression")
+            self._fail(f"Expected {kind!r}, got")
+        return self._next()
+    
+    def _or(self) -> tuple:
+        children = [self._and()]
+        while self._peek() == 'or':
+            self._next()
+            children.append(self._and())
+        return _combine('or', children)
+    
+    def _and(self) -> tuple:
+        children = [self._not()]
+        while self._peek() == 'and':
+            self._next()
+            children.append(self._not())
+        return _combine('and', children)
+    
+    def _not(self) -> tuple:
+        if self._peek() == 'not':
+            self._next()
+            return ('not', self._not())
+        if self._peek() == '(':
+            self._next()
+            node = self._or()
+            self._expect(')')
+            return node
+        return self._comparison()
+    
+    def _operand(self) -> Tuple[str, object]:
+        """('field', name) or ('value', number or label)"""
+        kind, value, _ = self._next()
+        if kind == 'word' and value in _REQUIREMENT_COLUMNS:
+            return 'field', value
+        if kind in ('word', 'string', 'number'):
+            return 'value', value
+        self.position -= 1
+        self._fail("Expected a field or value, got")
+    
+    def _comparison(self) -> tuple:
+        left = self._operand()
+        if self._peek() in ('in', 'not'):
+            negated = self._next()[0] == 'not'
+            if negated:
+                self._expect('in')
+            if left[0] != 'field':
+                raise RequirementSyntaxError(f"'in' needs a field on its left, got {left[1]!r}")
+            self._expect('(')
+            values = [self._operand()]
+            while self._peek() == ',':
+                self._next()
+                values.append(self._operand())
+            self._expect(')')
+            node = _membership_node(left[1], values)
+            return ('not', node) if negated else node
+        
+        # a < b <= c means a < b and b <= c
+        children = []
+        while self._peek() == 'op':
+            comparison = self._next()[1]
+            right = self._operand()
+            children.append(_comparison_node(left, comparison, right))
+            left = right
+        if not children:
+            if self.position < len(self.tokens):
+                self._fail("Expected a comparison, got")
+            raise RequirementSyntaxError("Expected a comparison at end of requirements expression")
+        return _combine('and', children)
+
+
+def _combine(kind: str, children: List[tuple]) -> tuple:
+    """One 'and' / 'or' node with nested nodes of the same kind flattened into it"""
+    if len(children) == 1:
+        return children[0]
+    flat = []
+    for child in children:
+        flat.extend(child[1:] if child[0] == kind else (child,))
+    return (kind, *flat)
+
+
+# Columns a requirement can test: metric name -> index, categorical fields by name
+_REQUIREMENT_COLUMNS = dict(METRIC_INDEX, expat_community_size='expat_community_size',
+                            region='region', sub_region='sub_region')
+
+
+def _requirement_value(name: str, value) -> object:
+    """Coerce a literal to what the column stores: a float, an expat code or a folded region label"""
+    if name in METRIC_INDEX:
+        if not isinstance(value, float) or not math.isfinite(value):
+            raise RequirementSyntaxError(f"{name} must be compared with a finite number, got {value!r}")
+        return value
+    if name == 'expat_community_size':
+        if isinstance(value, float) and not value.is_integer():
+            raise RequirementSyntaxError(f"{name} codes are whole numbers, got {value!r}")
+        try:
+            return int(ExpatCommunitySize.parse(int(value) if isinstance(value, float) else value))
+        except ValueError as error:
+            raise RequirementSyntaxError(str(error)) from None
+    if isinstance(value, float):
+        raise RequirementSyntaxError(f"{name} must be compared with a label, got {value!r}")
+    return _fold_name(value)
+
+
+def _comparison_node(left: Tuple[str, object], comparison: str, right: Tuple[str, object]) -> tuple:
+    if left[0] == 'value' and right[0] == 'field':
+        left, comparison, right = right, _FLIPPED_COMPARISONS[comparison], left
+    if left[0] != 'field' or right[0] != 'value':
+        raise RequirementSyntaxError(
+            f"Comparisons need one field from {tuple(_REQUIREMENT_COLUMNS)} and one value: "
+            f"{left[1]!r} {comparison} {right[1]!r}"
+        )
+    name = left[1]
+    value = _requirement_value(name, right[1])
+    if name in REGION_FIELDS:
+        if comparison not in ('==', '!='):
+            raise RequirementSyntaxError(f"{name} only supports ==, !=, in and not in")
+        node = ('in', name, frozenset((value,)))
+        return node if comparison == '==' else ('not', node)
+    return ('cmp', _REQUIREMENT_COLUMNS[name], comparison, value)
+
+
+def _membership_node(name: str, values: List[Tuple[str, object]]) -> tuple:
+    if any(kind != 'value' for kind, _ in values):
+        raise RequirementSyntaxError(f"'{name} in (...)' takes values, not fields")
+    return ('in', _REQUIREMENT_COLUMNS[name], frozenset(_requirement_value(name, value) for _, value in values))
+
+
+@lru_cache(maxsize=256)
+def parse_requirements(text: str) -> tuple:
+    """
+    Parse a requirements expression into its hashable tree
+    Raises RequirementSyntaxError (a ValueError) for malformed expressions or unknown fields
+    """
+    return _RequirementParser(text).parse()
+
+
+def _requirement_terms(node: tuple) -> List[tuple]:
+    """Top-level conjuncts of a tree"""
+    return list(node[1:]) if node[0] == 'and' else [node]
+
+
+def _requirement_columns(node: tuple) -> Iterator[int]:
+    """Metric column indexes a tree reads"""
+    if node[0] in ('and', 'or', 'not'):
+        for child in node[1:]:
+            yield from _requirement_columns(child)
+    elif isinstance(node[1], int):
+        yield node[1]
+
+
+def _requirement_mask(node: tuple, store: 'CountryStore', raw, rows=None):
+    """Vectorized evaluation: a boolean array over rows (every store row when None)"""
+    kind = node[0]
+    if kind in ('and', 'or'):
+        mask = _requirement_mask(node[1], store, raw, rows)
+        for child in node[2:]:
+            if kind == 'and':
+                mask &= _requirement_mask(child, store, raw, rows)
+            else:
+                mask |= _requirement_mask(child, store, raw, rows)
+        return mask
+    if kind == 'not':
+        return ~_requirement_mask(node[1], store, raw, rows)
+    
+    column = node[1]
+    if column == 'expat_community_size':
+        values = np.frombuffer(store.expat_codes, dtype=np.int8)
+    elif column in REGION_FIELDS:
+        values = np.frombuffer(store.region_codes if column == 'region' else store.sub_region_codes, dtype=np.uint16)
+    else:
+        values = raw[column]
+    if rows is not None:
+        values = values[rows]
+    if kind == 'cmp':
+        return _COMPARISON_FUNCTIONS[node[2]](values, node[3])
+    members = store.region_codes_for(node[2], untagged=True) if column in REGION_FIELDS else node[2]
+    return np.isin(values, list(members))
+
+
+_COMPARISON_FUNCTIONS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq, '!=': operator.ne
+}
+# Column variables of generated predicates
+_PREDICATE_COLUMNS = {'expat_community_size': 'expat', 'region': 'region', 'sub_region': 'sub_region'}
+
+
+@lru_cache(maxsize=256)
+def _requirement_code(node: tuple):
+    """
+    Generate and compile `lambda row: ...` for a tree
+    Returns the code object and the (variable, column, values) sets it reads,
+    which are bound per store since region codes differ between stores
+    """
+    constants = []
+    
+    def emit(node: tuple) -> str:
+        kind = node[0]
+        if kind in ('and', 'or'):
+            return '(' + f' {kind} '.join(emit(child) for child in node[1:]) + ')'
+        if kind == 'not':
+            return f'(not {emit(node[1])})'
+        column = node[1]
+        variable = _PREDICATE_COLUMNS.get(column) or f'metric_{column}'
+        if kind == 'cmp':
+            return f'{variable}[row] {node[2]} {node[3]!r}'
+        constants.append((f'members_{len(constants)}', column, node[2]))
+        return f'{variable}[row] in {constants[-1][0]}'
+    
+    # The tree only holds validated operators, column indexes and numbers, so the source is safe to compile
+    source = f'lambda row: {emit(node)}'
+    return compile(source, '<requirements>', 'eval'), tuple(constants)
+
+
+def _requirement_predicate(node: tuple, store: 'CountryStore'):
+    """Pure-Python evaluation: a closure testing one row id against the store's columns"""
+    code, constants = _requirement_code(node)
+    namespace = {'__builtins__': {}, 'expat': store.expat_codes, 'region': store.region_codes,
+                 'sub_region': store.sub_region_codes}
+    namespace.update((f'metric_{index}', column) for index, column in enumerate(store.columns))
+    for variable, column, values in constants:
+        namespace[variable] = store.region_codes_for(values, untagged=True) if column in REGION_FIELDS else values
+    return eval(code, namespace)
 
 
 @dataclass
@@ -48,304 +1809,1190 @@ class UserCriteria:
     min_requirements: Dict[str, float] = field(default_factory=dict)
     preferred_regions: List[str] = field(default_factory=list)
     deal_breakers: List[str] = field(default_factory=list)
+    requirements: str = ''  # Requirement expression, e.g. "cost_of_living_index <= 50 and visa_ease >= 70"
     
     def __post_init__(self):
         # Default weights if none provided
         if not self.weights:
-            self.weights = {
-                'cost_of_living_index': 0.15,
-                'quality_of_life_index': 0.20,
-                'safety_index': 0.15,
-                'healthcare_index': 0.10,
-                'climate_score': 0.10,
-                'job_market_score': 0.10,
-                'english_proficiency': 0.05,
-                'visa_ease': 0.10,
-                'tax_friendliness': 0.05
-            }
+            self.weights = dict(DEFAULT_WEIGHTS)
+    
+    def compile(self, strict: bool = True) -> 'CompiledCriteria':
+        """
+        Validate criterion names once and resolve them to store column indices
+        With strict=False unknown names are ignored instead of raising ValueError,
+        which is how recommend_countries has always treated them
+        The requirements expression is parsed (always strictly) into a tree;
+        its top-level `metric >= value` terms join min_requirements so they can
+        use the sorted indexes, and the rest is evaluated as one predicate
+        """
+        unknown = sorted((set(self.weights) | set(self.min_requirements)) - set(METRIC_INDEX))
+        if unknown and strict:
+            raise ValueError(f"Unknown criteria: {', '.join(unknown)}; expected names from {METRIC_FIELDS}")
+        unknown = sorted(set(self.deal_breakers) - set(DEAL_BREAKERS))
+        if unknown and strict:
+            raise ValueError(f"Unknown deal breakers: {', '.join(unknown)}; expected names from {tuple(DEAL_BREAKERS)}")
+        
+        weighted = sorted(
+            (METRIC_INDEX[criterion], float(weight))
+            for criterion, weight in self.weights.items()
+            if criterion in METRIC_INDEX
+        )
+        minimums = {
+            METRIC_INDEX[criterion]: float(min_value)
+            for criterion, min_value in self.min_requirements.items()
+            if criterion in METRIC_INDEX
+        }
+        expression = None
+        if self.requirements.strip():
+            residual = []
+            for term in _requirement_terms(parse_requirements(self.requirements.strip())):
+                if term[0] == 'cmp' and isinstance(term[1], int) and term[2] == '>=':
+                    minimums[term[1]] = max(term[3], minimums.get(term[1], term[3]))
+                else:
+                    residual.append(term)
+            expression = _combine('and', residual) if residual else None
+        requirements = sorted(minimums.items())
+        return CompiledCriteria(
+            weight_indexes=tuple(index for index, _ in weighted),
+            weights=tuple(weight for _, weight in weighted),
+            requirements=tuple(requirements),
+            preferred_regions=tuple(sorted({_fold_name(region) for region in self.preferred_regions})),
+            deal_breakers=tuple(sorted(set(self.deal_breakers) & set(DEAL_BREAKERS))),
+            expression=expression
+        )
+
+
+@dataclass(frozen=True)
+class CompiledCriteria:
+    """
+    Immutable UserCriteria resolved to column indices (see UserCriteria.compile)
+    Hashable, so it doubles as a cache key
+    """
+    __slots__ = (
+        'weight_indexes', 'weights', 'requirements', 'preferred_regions', 'deal_breakers', 'expression'
+    )
+    weight_indexes: Tuple[int, ...]  # Columns with a weight, in column order
+    weights: Tuple[float, ...]
+    requirements: Tuple[Tuple[int, float], ...]  # (column index, minimum value)
+    preferred_regions: Tuple[str, ...]  # Case-folded region / sub-region names; empty means anywhere
+    deal_breakers: Tuple[str, ...]  # Names from DEAL_BREAKERS
+    expression: Optional[tuple]  # Parsed requirements left after lifting `metric >= value` terms
+    
+    @property
+    def criteria_names(self) -> Tuple[str, ...]:
+        """Field names of the weighted columns, as used for breakdown keys"""
+        return tuple(METRIC_FIELDS[index] for index in self.weight_indexes)
+    
+    @property
+    def columns(self) -> Tuple[int, ...]:
+        """Every metric column the results depend on: weighted, required, expression and deal-breaker ones"""
+        columns = set(self.weight_indexes).union(index for index, _ in self.requirements)
+        if self.expression is not None:
+            columns.update(_requirement_columns(self.expression))
+        columns.update(
+            METRIC_INDEX[DEAL_BREAKERS[name].field] for name in self.deal_breakers
+            if DEAL_BREAKERS[name].field in METRIC_INDEX
+        )
+        return tuple(sorted(columns))
+
+
+@dataclass
+class CacheStats:
+    """Counters for a RecommendationCache"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0  # Times invalidate() cleared the cache
+    stale: int = 0  # Entries dropped because data they depend on changed
+    size: int = 0
+    maxsize: int = 0
+
+
+class RecommendationCache:
+    """
+    Bounded LRU mapping of (criteria key, top_n) to (dataset version, results)
+    One lives on each store (see CountryStore.result_cache) and is shared by
+    every agent using it, so it is locked
+    """
+    
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._stats = CacheStats(maxsize=maxsize)
+        self._lock = threading.Lock()
+    
+    def get(self, key, is_current=None):
+        """
+        Return the cached value (marking it most recently used) or None
+        is_current(value) can reject an entry whose inputs changed since it
+        was stored; the entry is then dropped and counted as stale
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None and is_current is not None and not is_current(value):
+                del self._entries[key]
+                self._stats.stale += 1
+                value = None
+            if value is None:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+    
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+    
+    def grow(self, maxsize: int):
+        """Raise the bound to maxsize; agents sharing the cache get the largest size any of them asked for"""
+        with self._lock:
+            if maxsize > self.maxsize:
+                self.maxsize = self._stats.maxsize = maxsize
+    
+    def invalidate(self):
+        """Drop every entry"""
+        with self._lock:
+            if self._entries:
+                self._entries.clear()
+                self._stats.invalidations += 1
+    
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return replace(self._stats, size=len(self._entries))
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class PipelineStats:
+    """Row counts for each stage of the recommendation pipeline"""
+    runs: int = 0
+    rows_considered: int = 0  # Rows in the store when evaluation started
+    outside_regions: int = 0  # Skipped because they are not in preferred_regions
+    failed_requirements: int = 0  # Eliminated by min_requirements
+    failed_deal_breakers: int = 0  # Met the requirements but hit a deal breaker
+    scored: int = 0  # Survivors that were scored
+    scored_zero: int = 0  # Scored rows whose total was zero (still eligible)
+    returned: int = 0  # Rows handed back to the caller
+    
+    def merge(self, other: 'PipelineStats'):
+        """Add another run's counts into this one"""
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+# Display names for breakdown keys
+EXPLANATION_LABELS = {
+    name: spec.label if spec.higher_is_better else f"{spec.label} (inverted)" for name, spec in METRIC_SPECS.items()
+}
+# printf-style pieces of an explanation; a whole explanation is filled in with one % operation
+_EXPLANATION_HEADER = (
+    "\n" + "=" * 60 + "\n"
+    "Country: %s\n"
+    "Overall Score: %.2f/100\n"
+    + "=" * 60 + "\n\n"
+    "Score Breakdown:\n"
+    + "-" * 60 + "\n"
+)
+_EXPLANATION_STATISTICS = (
+    "\nKey Statistics:\n"
+    + "-" * 60 + "\n"
+    "  Cost of Living Index: %s/100 (lower is cheaper)\n"
+    "  Safety Index: %s/100\n"
+    "  Healthcare Index: %s/100\n"
+    "  Average Internet Speed: %s Mbps\n"
+    "  Expat Community: %s\n"
+)
+_STATISTICS_COLUMNS = tuple(
+    METRIC_INDEX[name] for name in ('cost_of_living_index', 'safety_index', 'healthcare_index', 'internet_speed')
+)
+_BY_WEIGHTED_SCORE = operator.itemgetter(1)
+
+
+# Breakdown labels padded with dot leaders once, instead of on every render
+_PADDED_LABELS = {name: f"{label:.<40}" for name, label in EXPLANATION_LABELS.items()}
+
+
+@lru_cache(maxsize=64)
+def _explanation_template(breakdown_size: int) -> str:
+    """Template for an explanation with breakdown_size breakdown lines"""
+    return _EXPLANATION_HEADER + "  %s %6.2f\n" * breakdown_size + _EXPLANATION_STATISTICS
+
+
+def _render_explanation(country: CountryData, score: float, breakdown: Dict[str, float]) -> str:
+    """Fill the explanation template in one % operation"""
+    store = country._attach()
+    row = country._row
+    values = [country.name, score]
+    for criterion, weighted_score in sorted(breakdown.items(), key=_BY_WEIGHTED_SCORE, reverse=True):
+        values.append(_PADDED_LABELS.get(criterion) or f"{criterion:.<40}")
+        values.append(weighted_score)
+    for index in _STATISTICS_COLUMNS:
+        # Whole numbers print without a trailing .0, as the int data they were loaded from did
+        value = store.columns[index][row]
+        values.append(int(value) if value.is_integer() else value)
+    values.append(_EXPAT_LABELS[store.expat_codes[row]])
+    return _explanation_template(len(breakdown)) % tuple(values)
+
+
+class Recommendation:
+    """
+    One ranked result: rank (1-based), store row id, total score and a
+    per-criterion breakdown that is only computed when first read
+    Unpacks and indexes like the (country, score, breakdown) tuples it replaces
+    """
+    __slots__ = ('rank', 'row_id', 'score', 'version', '_store', '_criteria', '_weighted_scores')
+    
+    def __init__(self, store: CountryStore, criteria: CompiledCriteria, rank: int, row_id: int, score: float,
+                 version: Optional[int] = None):
+        self.rank = rank
+        self.row_id = row_id
+        self.score = score
+        self.version = store.version if version is None else version  # Store version the score was computed at
+        self._store = store
+        self._criteria = criteria
+        self._weighted_scores: Optional[array] = None
+    
+    @property
+    def country(self) -> CountryData:
+        return self._store[self.row_id]
+    
+    @property
+    def weighted_scores(self) -> array:
+        """Weighted score per criterion as array('d'), in criteria order, from the store's data when first read"""
+        if self._weighted_scores is None:
+            store, criteria, row = self._store, self._criteria, self.row_id
+            self._weighted_scores = array('d', [
+                store.normalized_value(index, row) * weight
+                for index, weight in zip(criteria.weight_indexes, criteria.weights)
+            ])
+        return self._weighted_scores
+    
+    @property
+    def stale(self) -> bool:
+        """Whether data the score depends on changed since it was computed; a breakdown read now may not match"""
+        return self._store.changed_since(self.version, self._criteria.columns)
+    
+    @property
+    def breakdown(self) -> Dict[str, float]:
+        """Weighted score per criterion name; a new dict on every access"""
+        return dict(zip(self._criteria.criteria_names, self.weighted_scores))
+    
+    def explain(self) -> str:
+        """Human-readable explanation, as from explain_recommendation"""
+        return _render_explanation(self.country, self.score, self.breakdown)
+    
+    def _as_tuple(self) -> Tuple[CountryData, float, Dict[str, float]]:
+        return self.country, self.score, self.breakdown
+    
+    def __iter__(self) -> Iterator:
+        return iter(self._as_tuple())
+    
+    def __len__(self) -> int:
+        return 3
+    
+    def __getitem__(self, index):
+        if index == 1:
+            return self.score
+        return self._as_tuple()[index]
+    
+    def __eq__(self, other):
+        if isinstance(other, Recommendation):
+            return self._as_tuple() == other._as_tuple()
+        if isinstance(other, tuple):
+            return self._as_tuple() == other
+        return NotImplemented
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        return f"Recommendation(rank={self.rank}, country={self._store.names[self.row_id]!r}, score={self.score!r})"
+
+
+class RecommendationSet:
+    """
+    Ranked results backed by parallel row id and score arrays
+    Behaves like a read-only list of Recommendations, which are only created
+    for the positions actually accessed, so paging through thousands of
+    results allocates nothing per row up front
+    """
+    __slots__ = ('row_ids', 'scores', 'first_rank', 'version', 'weighted', '_store', '_criteria')
+    
+    def __init__(self, store: CountryStore, criteria: CompiledCriteria, row_ids: array, scores: array,
+                 first_rank: int = 1, version: Optional[int] = None, weighted: Optional[array] = None):
+        self.row_ids = row_ids  # array('q')
+        self.scores = scores  # array('d')
+        self.first_rank = first_rank  # Rank of the first result; slices keep their original ranks
+        self.version = store.version if version is None else version  # Store version the scores were computed at
+        self.weighted = weighted  # breakdowns() captured by materialize(), or None to read the store
+        self._store = store
+        self._criteria = criteria
+    
+    @classmethod
+    def from_ranked(cls, store: CountryStore, criteria: CompiledCriteria, ranked: List[Tuple[int, float]],
+                    first_rank: int = 1, version: Optional[int] = None) -> 'RecommendationSet':
+        """Build from (row, score) pairs in rank order"""
+        row_ids = array('q', [row for row, _ in ranked])
+        return cls(store, criteria, row_ids, array('d', [score for _, score in ranked]), first_rank, version)
+    
+    def __len__(self) -> int:
+        return len(self.row_ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[position] for position in range(start, stop, step)]
+            width = len(self._criteria.weight_indexes)
+            weighted = None if self.weighted is None else self.weighted[start * width:stop * width]
+            return RecommendationSet(self._store, self._criteria, self.row_ids[start:stop], self.scores[start:stop],
+                                     self.first_rank + start, self.version, weighted)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("RecommendationSet index out of range")
+        return self._recommendation(index)
+    
+    def __iter__(self) -> Iterator[Recommendation]:
+        if self.weighted is not None:
+            return map(self._recommendation, range(len(self)))
+        return self._iter_lazy()
+    
+    def _iter_lazy(self) -> Iterator[Recommendation]:
+        store, criteria, rank, version = self._store, self._criteria, self.first_rank, self.version
+        for offset, (row, score) in enumerate(zip(self.row_ids, self.scores)):
+            yield Recommendation(store, criteria, rank + offset, row, score, version)
+    
+    def _recommendation(self, index: int) -> Recommendation:
+        result = Recommendation(self._store, self._criteria, self.first_rank + index, self.row_ids[index],
+                                self.scores[index], self.version)
+        if self.weighted is not None:
+            width = len(self._criteria.weight_indexes)
+            result._weighted_scores = self.weighted[index * width:(index + 1) * width]
+        return result
+    
+    def countries(self) -> List[CountryData]:
+        return [self._store[row] for row in self.row_ids]
+    
+    @property
+    def stale(self) -> bool:
+        """Whether data the scores depend on changed since they were computed"""
+        return self._store.changed_since(self.version, self._criteria.columns)
+    
+    def breakdowns(self) -> array:
+        """
+        Every result's weighted scores in one row-major array('d') of
+        len(self) x len(criteria_names), without building any dicts
+        """
+        if self.weighted is not None:
+            return array('d', self.weighted)
+        store, criteria = self._store, self._criteria
+        if store._matrices is not None and len(self):
+            # The NumPy engine's normalized matrix is current: gather every cell in one indexing operation
+            rows = np.frombuffer(self.row_ids, dtype=np.int64)
+            cells = store._matrices[1][np.ix_(list(criteria.weight_indexes), rows)]
+            cells = cells * np.array(criteria.weights)[:, None]
+            return array('d', np.ascontiguousarray(cells.T).tobytes())
+        columns = [
+            (store._current_normalized(index), weight)
+            for index, weight in zip(criteria.weight_indexes, criteria.weights)
+        ]
+        if all(column is not None for column, _ in columns):
+            # The pure-Python engine scored from these same columns
+            return array('d', [column[row] * weight for row in self.row_ids for column, weight in columns])
+        cell = store.normalized_value
+        weighted = list(zip(criteria.weight_indexes, criteria.weights))
+        return array('d', [cell(index, row) * weight for row in self.row_ids for index, weight in weighted])
+    
+    def materialize(self) -> 'RecommendationSet':
+        """Capture every breakdown now, so later reads match the scores even if the store changes"""
+        if self.weighted is None:
+            self.weighted = self.breakdowns()
+        return self
+    
+    @property
+    def criteria_names(self) -> Tuple[str, ...]:
+        return self._criteria.criteria_names
+    
+    def __eq__(self, other):
+        if isinstance(other, (RecommendationSet, list, tuple)):
+            return len(self) == len(other) and all(mine == theirs for mine, theirs in zip(self, other))
+        return NotImplemented
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        return f"RecommendationSet({list(self)!r})"
+
+
+def _canonical(node):
+    """node with every frozenset sorted, so its repr does not depend on hash randomization"""
+    if isinstance(node, frozenset):
+        return tuple(sorted(node, key=repr))
+    if isinstance(node, tuple):
+        return tuple(_canonical(item) for item in node)
+    return node
+
+
+def _cursor_token(criteria: CompiledCriteria, store: CountryStore) -> str:
+    """
+    Digest of compiled criteria and the store they rank; unlike the
+    process-salted hash() it is the same in every process sharing a dataset
+    """
+    import hashlib
+    fields = tuple(_canonical(getattr(criteria, name)) for name in CompiledCriteria.__slots__)
+    identity = store.dataset_key if store.dataset_key is not None else id(store)
+    return hashlib.blake2b(repr((fields, identity)).encode(), digest_size=8).hexdigest()
+
+
+class RankedCursor:
+    """
+    Every eligible row for one set of criteria in rank order, scored once
+    and served a page at a time (see CountryRelocationAgent.open_cursor)
+    Pages come from the compact rank order made when the cursor was opened.
+    A page of a mutable store captures its breakdowns as it is served, so
+    they keep matching its scores afterwards; a page served once the data
+    has changed is flagged by stale (and by each result's stale)
+    """
+    __slots__ = ('token', 'criteria', 'results', 'version', 'ttl', 'last_used')
+    
+    def __init__(self, token: str, criteria: CompiledCriteria, results: RecommendationSet, version: int,
+                 ttl: float = 300.0):
+        self.token = token  # Criteria digest, to hand back to get_cursor on the next request
+        self.criteria = criteria
+        self.results = results
+        self.version = version  # Store version the ranking was computed at
+        self.ttl = ttl  # Seconds the cursor is kept while idle
+        self.last_used = time.monotonic()
+    
+    def __len__(self) -> int:
+        return len(self.results)
+    
+    def page_count(self, page_size: int = 10) -> int:
+        return -(-len(self.results) // page_size)
+    
+    def page(self, number: int, page_size: int = 10) -> RecommendationSet:
+        """Results of the zero-based page number; past the end it is empty"""
+        if number < 0 or page_size <= 0:
+            raise ValueError(f"Expected a page number >= 0 and a page_size > 0, got {number} and {page_size}")
+        self.last_used = time.monotonic()
+        start = number * page_size
+        page = self.results[start:start + page_size]
+        # A frozen store cannot change, so its breakdowns can stay lazy
+        return page if page._store.frozen else page.materialize()
+    
+    @property
+    def stale(self) -> bool:
+        """Whether data the ranking depends on changed since the cursor was opened"""
+        return self.results._store.changed_since(self.version, self.criteria.columns)
+
+
+class CursorRegistry:
+    """
+    Open RankedCursors by token, one registry per store (see
+    CountryStore.cursor_registry); a cursor idle for longer than its ttl
+    expires, and at most maxsize are kept
+    """
+    
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._cursors: Dict[str, RankedCursor] = OrderedDict()
+        self._lock = threading.Lock()  # Agents on different threads share the registry of a shared dataset
+    
+    def get(self, token: str) -> Optional[RankedCursor]:
+        with self._lock:
+            self._expire()
+            cursor = self._cursors.get(token)
+            if cursor is not None:
+                cursor.last_used = time.monotonic()
+                self._cursors.move_to_end(token)
+            return cursor
+    
+    def put(self, cursor: RankedCursor):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._cursors[cursor.token] = cursor
+            self._cursors.move_to_end(cursor.token)
+            while len(self._cursors) > self.maxsize:
+                self._cursors.popitem(last=False)
+    
+    def expire(self) -> int:
+        """Drop cursors idle for longer than their ttl; returns how many were dropped"""
+        with self._lock:
+            return self._expire()
+    
+    def _expire(self) -> int:
+        now = time.monotonic()
+        # Paging touches cursors without reordering the registry, so check them all
+        idle = [token for token, cursor in self._cursors.items() if now - cursor.last_used > cursor.ttl]
+        for token in idle:
+            del self._cursors[token]
+        return len(idle)
+    
+    def clear(self):
+        with self._lock:
+            self._cursors.clear()
+    
+    def __len__(self) -> int:
+        return len(self._cursors)
 
 
 class CountryRelocationAgent:
     """AI Agent for recommending countries based on user criteria"""
     
-    def __init__(self):
-        self.countries = self._initialize_country_database()
-        
-    def _initialize_country_database(self) -> List[CountryData]:
-        """Initialize database with sample country data"""
-        return [
-            CountryData(
-                name="Portugal",
-                cost_of_living_index=45,
-                quality_of_life_index=75,
-                safety_index=82,
-                healthcare_index=72,
-                climate_score=85,
-                job_market_score=60,
-                english_proficiency=65,
-                visa_ease=75,
-                tax_friendliness=60,
-                internet_speed=95,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Spain",
-                cost_of_living_index=50,
-                quality_of_life_index=78,
-                safety_index=80,
-                healthcare_index=78,
-                climate_score=88,
-                job_market_score=58,
-                english_proficiency=60,
-                visa_ease=72,
-                tax_friendliness=55,
-                internet_speed=110,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Thailand",
-                cost_of_living_index=30,
-                quality_of_life_index=68,
-                safety_index=70,
-                healthcare_index=65,
-                climate_score=75,
-                job_market_score=55,
-                english_proficiency=50,
-                visa_ease=85,
-                tax_friendliness=70,
-                internet_speed=85,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Germany",
-                cost_of_living_index=65,
-                quality_of_life_index=85,
-                safety_index=85,
-                healthcare_index=88,
-                climate_score=65,
-                job_market_score=82,
-                english_proficiency=70,
-                visa_ease=60,
-                tax_friendliness=45,
-                internet_speed=120,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Mexico",
-                cost_of_living_index=35,
-                quality_of_life_index=65,
-                safety_index=55,
-                healthcare_index=60,
-                climate_score=80,
-                job_market_score=60,
-                english_proficiency=45,
-                visa_ease=90,
-                tax_friendliness=65,
-                internet_speed=70,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Canada",
-                cost_of_living_index=70,
-                quality_of_life_index=88,
-                safety_index=88,
-                healthcare_index=85,
-                climate_score=60,
-                job_market_score=80,
-                english_proficiency=95,
-                visa_ease=55,
-                tax_friendliness=50,
-                internet_speed=130,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Australia",
-                cost_of_living_index=75,
-                quality_of_life_index=90,
-                safety_index=87,
-                healthcare_index=87,
-                climate_score=85,
-                job_market_score=78,
-                english_proficiency=100,
-                visa_ease=50,
-                tax_friendliness=55,
-                internet_speed=110,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Estonia",
-                cost_of_living_index=48,
-                quality_of_life_index=72,
-                safety_index=82,
-                healthcare_index=70,
-                climate_score=55,
-                job_market_score=72,
-                english_proficiency=75,
-                visa_ease=80,
-                tax_friendliness=75,
-                internet_speed=150,
-                expat_community_size="Medium"
-            ),
-            CountryData(
-                name="New Zealand",
-                cost_of_living_index=72,
-                quality_of_life_index=87,
-                safety_index=90,
-                healthcare_index=82,
-                climate_score=82,
-                job_market_score=70,
-                english_proficiency=100,
-                visa_ease=52,
-                tax_friendliness=58,
-                internet_speed=105,
-                expat_community_size="Medium"
-            ),
-            CountryData(
-                name="Costa Rica",
-                cost_of_living_index=40,
-                quality_of_life_index=70,
-                safety_index=68,
-                healthcare_index=72,
-                climate_score=88,
-                job_market_score=58,
-                english_proficiency=52,
-                visa_ease=88,
-                tax_friendliness=68,
-                internet_speed=75,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Singapore",
-                cost_of_living_index=85,
-                quality_of_life_index=92,
-                safety_index=95,
-                healthcare_index=92,
-                climate_score=70,
-                job_market_score=88,
-                english_proficiency=85,
-                visa_ease=65,
-                tax_friendliness=80,
-                internet_speed=200,
-                expat_community_size="Large"
-            ),
-            CountryData(
-                name="Czech Republic",
-                cost_of_living_index=42,
-                quality_of_life_index=74,
-                safety_index=80,
-                healthcare_index=75,
-                climate_score=68,
-                job_market_score=70,
-                english_proficiency=65,
-                visa_ease=70,
-                tax_friendliness=65,
-                internet_speed=115,
-                expat_community_size="Medium"
-            ),
-        ]
+    ENGINES = ('auto', 'python', 'numpy')
+    # Bytes of users x countries scratch (float64 totals plus a bool mask) per recommend_countries_batch chunk
+    BATCH_MEMORY_BYTES = 64 << 20
     
-    def calculate_score(self, country: CountryData, criteria: UserCriteria) -> Tuple[float, Dict[str, float]]:
+    def __init__(self, engine: str = 'auto', cache_size: int = 128, data_path: Optional[str] = None,
+                 shared: bool = True, cursor_ttl: float = 300.0):
+        """
+        engine selects the scoring implementation: 'numpy' for the vectorized
+        matrix engine, 'python' for the pure-Python loop, or 'auto' to use
+        NumPy whenever it is installed
+        cache_size bounds the recommend_countries LRU result cache, which is
+        shared by every agent on the same store (0 disables it for this agent)
+        data_path is a CSV, JSON Lines or snapshot country file (defaults to the bundled countries.csv)
+        shared=True takes the dataset from the process-wide DATASETS registry
+        (read-only, loaded once); shared=False loads a private, mutable copy
+        cursor_ttl is how many seconds an idle open_cursor ranking is kept
+        Construction is cheap: the database and NumPy are only loaded when
+        the first recommendation (or anything else needing them) runs
+        """
+        self.engine = engine
+        self.pipeline_stats = PipelineStats()  # Cumulative over all runs
+        self.last_pipeline_stats = PipelineStats()
+        self.cache_size = cache_size
+        self.cursor_ttl = cursor_ttl
+        self.data_path = data_path or DEFAULT_DATA_PATH
+        self.shared = shared
+        self._loaded_store = None
+        self._dataset_handle = None
+    
+    @property
+    def engine(self) -> str:
+        """The scoring engine in use, 'numpy' or 'python'; 'auto' is resolved on first use"""
+        if self._engine != 'python' and _load_numpy() is None:
+            self._engine = 'python'  # 'auto' without NumPy; 'numpy' was checked when it was set
+        elif self._engine == 'auto':
+            self._engine = 'numpy'
+        return self._engine
+    
+    @engine.setter
+    def engine(self, engine: str):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}; expected one of {self.ENGINES}")
+        if engine == 'numpy' and np is None:
+            # Check without importing: NumPy itself is loaded on first use
+            from importlib.util import find_spec
+            if find_spec('numpy') is None:
+                raise ImportError("engine='numpy' requires NumPy to be installed")
+        self._engine = engine
+    
+    @property
+    def countries(self) -> CountryStore:
+        """Columnar country store; iterating it yields CountryData views"""
+        return self._store
+    
+    @countries.setter
+    def countries(self, countries: Union[CountryStore, Iterable[CountryData]]):
+        if self._loaded_store is not None:
+            self._release_dataset()
+        self._loaded_store = countries if isinstance(countries, CountryStore) else CountryStore(countries)
+    
+    @property
+    def cache(self) -> RecommendationCache:
+        """Result cache of the agent's store, shared with every agent on the same dataset"""
+        return self._store.result_cache(self.cache_size)
+    
+    @property
+    def cursors(self) -> CursorRegistry:
+        """Open cursors over the agent's store, shared with every agent on the same dataset"""
+        return self._store.cursor_registry()
+    
+    @property
+    def _store(self) -> CountryStore:
+        """The country store, loaded on first access"""
+        if self._loaded_store is None:
+            self.countries = self._initialize_country_database()
+        return self._loaded_store
+    
+    def _initialize_country_database(self) -> CountryStore:
+        """Get the country database for the agent's data file"""
+        if not self.shared:
+            return CountryStore.from_file(self.data_path)
+        key, store = DATASETS.acquire(self.data_path)
+        # Release the registry reference when the agent is closed or garbage collected
+        self._dataset_handle = weakref.finalize(self, DATASETS.release, key)
+        return store
+    
+    def _release_dataset(self):
+        if self._dataset_handle is not None:
+            self._dataset_handle()
+            self._dataset_handle = None
+    
+    def close(self):
+        """Release the agent's reference to its shared dataset"""
+        self._release_dataset()
+    
+    def _writable_store(self) -> CountryStore:
+        """The agent's store, first swapped for a private copy if it is the shared read-only one"""
+        if self._store.frozen:
+            self.countries = self._store.copy()
+        return self._store
+    
+    def update_country(self, name: str, **fields) -> CountryData:
+        """
+        Patch one country in place, e.g. update_country('Portugal', safety_index=82)
+        Sorted indexes and NumPy matrices are updated incrementally, and only
+        cached results that use a changed column are recomputed. An agent on
+        a shared dataset switches to a private copy on its first update
+        """
+        return self._writable_store().update_country(name, **fields)
+    
+    def upsert_many(self, rows: Iterable[Union[CountryData, Dict]]) -> Tuple[int, int]:
+        """Apply a batch of updates and new countries (see CountryStore.upsert_many); returns (updated, inserted)"""
+        return self._writable_store().upsert_many(rows)
+    
+    def get_country(self, name: str) -> CountryData:
+        """
+        Look up a country by name, ignoring case, or by an alias such as
+        'Czechia' or an ISO code (see COUNTRY_ALIASES); raises KeyError
+        """
+        return self._store[self._store.row_of(name)]
+    
+    def get_countries(self, names: Iterable[str]) -> List[CountryData]:
+        """Look up several countries at once, in order; raises KeyError naming every unknown one"""
+        store = self._store
+        names = list(names)
+        rows = [store.find_row(name) for name in names]
+        missing = [name for name, row in zip(names, rows) if row is None]
+        if missing:
+            raise KeyError(f"No countries named {', '.join(map(repr, missing))}")
+        return [store[row] for row in rows]
+    
+    def calculate_score(self, country: CountryData,
+                        criteria: Union[UserCriteria, CompiledCriteria]) -> Tuple[float, Dict[str, float]]:
         """
         Calculate weighted score for a country based on user criteria
         Returns total score and breakdown by category
         """
+        compiled = self._compile(criteria)
+        columns = country._attach().columns
+        row = country._row
         scores = {}
         total_score = 0
         
-        for criterion, weight in criteria.weights.items():
-            if hasattr(country, criterion):
-                raw_value = getattr(country, criterion)
-                
-                # Invert cost of living (lower is better)
-                if criterion == 'cost_of_living_index':
-                    normalized_value = 100 - raw_value
-                else:
-                    normalized_value = raw_value
-                
-                # Check minimum requirements
-                if criterion in criteria.min_requirements:
-                    if raw_value < criteria.min_requirements[criterion]:
-                        return 0, {}  # Fails minimum requirement
-                
-                weighted_score = normalized_value * weight
-                scores[criterion] = weighted_score
-                total_score += weighted_score
+        # Every minimum, including ones on unweighted columns and `metric >= value` terms lifted from the expression
+        if any(columns[index][row] < min_value for index, min_value in compiled.requirements):
+            return 0, {}  # Fails minimum requirement
+        if compiled.expression is not None and not _requirement_predicate(compiled.expression, country._store)(row):
+            return 0, {}  # Fails the requirements expression
+        
+        for index, weight in zip(compiled.weight_indexes, compiled.weights):
+            # Scored on the metric's normalized 0-100 scale (cost of living is inverted)
+            normalized_value = country._store.normalized_value(index, row)
+            
+            weighted_score = normalized_value * weight
+            scores[METRIC_FIELDS[index]] = weighted_score
+            total_score += weighted_score
         
         return total_score, scores
     
-    def filter_countries(self, criteria: UserCriteria) -> List[CountryData]:
-        """Filter countries based on deal-breakers and minimum requirements"""
-        filtered = []
+    @staticmethod
+    def _compile(criteria: Union[UserCriteria, CompiledCriteria]) -> CompiledCriteria:
+        """Accept either form of criteria; plain UserCriteria are compiled leniently"""
+        if isinstance(criteria, CompiledCriteria):
+            return criteria
+        return criteria.compile(strict=False)
+    
+    def _requirement_candidates(self, criteria: CompiledCriteria) -> Tuple[array, List[Tuple[int, float]]]:
+        """
+        Binary-search every minimum requirement in its sorted index
+        Returns the rows passing the most selective requirement (None when there
+        are no requirements) and the remaining (column index, min) pairs that
+        still have to be probed on those rows
+        """
+        requirements = criteria.requirements
+        if not requirements:
+            return None, []
         
-        for country in self.countries:
-            # Check minimum requirements
-            meets_requirements = True
-            for criterion, min_value in criteria.min_requirements.items():
-                if hasattr(country, criterion):
-                    if getattr(country, criterion) < min_value:
-                        meets_requirements = False
-                        break
-            
-            if meets_requirements:
-                filtered.append(country)
+        # Drive from the requirement with the fewest survivors
+        positions = [self._store.sorted_index(index).position(min_value) for index, min_value in requirements]
+        driver = max(range(len(requirements)), key=positions.__getitem__)
+        rows = self._store.sorted_index(requirements[driver][0]).rows[positions[driver]:]
+        return rows, list(requirements[:driver] + requirements[driver + 1:])
+    
+    def _candidates(self, criteria: CompiledCriteria) -> Tuple[Optional[array], List[Tuple[int, float]], int]:
+        """
+        Narrow the store before scoring: intersect preferred_regions (from the
+        region index) with the most selective minimum requirement
+        Returns candidate rows (None for all rows), the requirements still to
+        probe on them and the number of rows outside the preferred regions
+        """
+        rows, remaining = self._requirement_candidates(criteria)
+        if not criteria.preferred_regions:
+            return rows, remaining, 0
         
-        return filtered
+        store = self._store
+        region_rows = store.region_rows(criteria.preferred_regions)
+        outside = len(store) - len(region_rows)
+        if rows is None or len(region_rows) <= len(rows):
+            # The region is the smaller set: drive from it and probe every requirement
+            return region_rows, list(criteria.requirements), outside
+        # The requirement is more selective: keep its survivors that are in the region
+        codes = store.region_codes_for(criteria.preferred_regions)
+        region_codes, sub_region_codes = store.region_codes, store.sub_region_codes
+        rows = array('q', (row for row in rows if region_codes[row] in codes or sub_region_codes[row] in codes))
+        return rows, remaining, outside
+    
+    def _filter_rows(self, criteria: CompiledCriteria) -> List[int]:
+        """
+        Return ids of store rows in the preferred regions that meet the minimum
+        requirements and the requirements expression and hit no deal breaker,
+        in store order
+        """
+        rows, remaining, _ = self._candidates(criteria)
+        if rows is None:
+            rows = range(len(self._store))
+        probes = [(self._store.columns[index], min_value) for index, min_value in remaining]
+        rows = [row for row in rows if all(column[row] >= min_value for column, min_value in probes)]
+        if criteria.expression is not None:
+            rows = list(filter(_requirement_predicate(criteria.expression, self._store), rows))
+        return sorted(self._without_deal_breakers(criteria, rows))
     
-    def recommend_countries(self, criteria: UserCriteria, top_n: int = 5) -> List[Tuple[CountryData, float, Dict]]:
+    def _without_deal_breakers(self, criteria: CompiledCriteria, rows: List[int]) -> List[int]:
+        """Drop rows hitting any of the criteria's deal breakers: one AND against the row's precompiled bits"""
+        mask = self._store.deal_breaker_mask(criteria.deal_breakers)
+        if not mask:
+            return rows
+        bits = self._store.deal_breaker_bits
+        return [row for row in rows if not bits[row] & mask]
+    
+    def filter_countries(self, criteria: Union[UserCriteria, CompiledCriteria]) -> List[CountryData]:
+        """Filter countries based on deal-breakers and minimum requirements"""
+        return [self._store[row] for row in self._filter_rows(self._compile(criteria))]
+    
+    def recommend_countries(self, criteria: Union[UserCriteria, CompiledCriteria],
+                            top_n: int = 5) -> RecommendationSet:
         """
         Main method: Recommend top countries based on criteria
-        Returns list of (country, score, breakdown) tuples
+        Returns a read-only RecommendationSet of Recommendations, which unpack
+        as (country, score, breakdown), ties broken by country name;
+        breakdowns are only computed for the results whose breakdown is read
+        Results are served from the LRU cache when the same criteria were
+        asked for before and none of the data they depend on has changed
         """
-        # Filter countries
-        eligible_countries = self.filter_countries(criteria)
-        
-        # Calculate scores
-        scored_countries = []
-        for country in eligible_countries:
-            score, breakdown = self.calculate_score(country, criteria)
-            if score > 0:  # Only include countries that passed all checks
-                scored_countries.append((country, score, breakdown))
+        compiled = self._compile(criteria)
+        store = self._store
+        key = (compiled, top_n)
+        cache = self.cache if self.cache_size > 0 else None
+        if cache is not None:
+            cached = cache.get(key, lambda entry: not store.changed_since(entry[0], compiled.columns))
+            if cached is not None:
+                return cached[1]
+        version = store.version
         
-        # Sort by score
-        scored_countries.sort(key=lambda x: x[1], reverse=True)
+        rows, scores, stats = self._evaluate(compiled)
+        ranked = self._top_rows(rows, scores, top_n)
+        stats.returned = len(ranked)
+        self._record_stats(stats)
+        results = self._build_results(compiled, ranked)
+        if cache is not None:
+            cache.put(key, (version, results))
+        return results
+    
+    def open_cursor(self, criteria: Union[UserCriteria, CompiledCriteria]) -> RankedCursor:
+        """
+        Rank every eligible country once and keep the order for paging
+        The cursor is registered with the store under a digest of the criteria,
+        so any agent on the same dataset opening the same criteria again (or
+        get_cursor with its token) reuses the ranking until the data it
+        depends on changes or it sits idle for cursor_ttl
+        """
+        compiled = self._compile(criteria)
+        store = self._store
+        registry = store.cursor_registry()
+        token = _cursor_token(compiled, store)
+        cursor = registry.get(token)
+        if cursor is not None and cursor.criteria == compiled and not cursor.stale:
+            return cursor
         
-        return scored_countries[:top_n]
+        version = store.version
+        rows, scores, stats = self._evaluate(compiled)
+        results = self._build_results(compiled, self._top_rows(rows, scores, len(rows)), 1, version)
+        self._record_stats(stats)
+        cursor = RankedCursor(token, compiled, results, version, self.cursor_ttl)
+        registry.put(cursor)
+        return cursor
     
-    def explain_recommendation(self, country: CountryData, score: float, breakdown: Dict) -> str:
-        """Generate human-readable explanation for recommendation"""
-        explanation = f"\n{'='*60}\n"
-        explanation += f"Country: {country.name}\n"
-        explanation += f"Overall Score: {score:.2f}/100\n"
-        explanation += f"{'='*60}\n\n"
+    def get_cursor(self, token: str) -> RankedCursor:
+        """A cursor opened earlier, by its token; raises KeyError once it expired"""
+        cursor = self.cursors.get(token)
+        if cursor is None:
+            raise KeyError(f"No open cursor {token!r}; it may have expired")
+        return cursor
+    
+    def recommend_page(self, criteria: Union[UserCriteria, CompiledCriteria], number: int,
+                       page_size: int = 10) -> RecommendationSet:
+        """Zero-based page number of the ranking for criteria, scoring only when no live cursor has it"""
+        return self.open_cursor(criteria).page(number, page_size)
+    
+    def cache_stats(self) -> CacheStats:
+        """Hit/miss/eviction counters of the recommendation cache shared by agents on this store"""
+        return self.cache.stats()
+    
+    def iter_recommendations(self, criteria: Union[UserCriteria, CompiledCriteria]) -> Iterator[Recommendation]:
+        """
+        Lazily yield every eligible country in rank order
+        Scores are computed up front, but ordering work and breakdowns are only
+        spent on the results actually consumed
+        """
+        compiled = self._compile(criteria)
+        version = self._store.version
+        rows, scores, stats = self._evaluate(compiled)
+        self._record_stats(stats)
         
-        explanation += "Score Breakdown:\n"
-        explanation += "-" * 60 + "\n"
+        if self.engine == 'numpy':
+            # Select successively larger blocks with argpartition
+            block = 16
+            while len(rows):
+                ranked = self._top_rows(rows, scores, block)
+                for result in self._build_results(compiled, ranked, stats.returned + 1, version):
+                    stats.returned += 1
+                    self.pipeline_stats.returned += 1
+                    yield result
+                keep = ~np.isin(rows, [row for row, _ in ranked])
+                rows, scores = rows[keep], scores[keep]
+                block *= 2
+            return
         
-        criteria_names = {
-            'cost_of_living_index': 'Cost of Living (inverted)',
-            'quality_of_life_index': 'Quality of Life',
-            'safety_index': 'Safety',
-            'healthcare_index': 'Healthcare',
-            'climate_score': 'Climate',
-            'job_market_score': 'Job Market',
-            'english_proficiency': 'English Proficiency',
-            'visa_ease': 'Visa Accessibility',
-            'tax_friendliness': 'Tax Friendliness'
-        }
+        # Order by score alone and read names only to settle rows that tie
+        names = self._store.names
+        heap = list(zip([-score for score in scores], rows))
+        heapq.heapify(heap)
+        while heap:
+            negative_score, row = heapq.heappop(heap)
+            tied = [row]
+            while heap and heap[0][0] == negative_score:
+                tied.append(heapq.heappop(heap)[1])
+            if len(tied) > 1:
+                tied.sort(key=lambda row: (names[row], row))
+            for row in tied:
+                stats.returned += 1
+                self.pipeline_stats.returned += 1
+                yield Recommendation(self._store, compiled, stats.returned, row, -negative_score, version)
+    
+    def _record_stats(self, stats: PipelineStats):
+        self.last_pipeline_stats = stats
+        self.pipeline_stats.merge(stats)
+    
+    def _evaluate(self, criteria: CompiledCriteria):
+        """
+        Fused filter + score pass: regions, requirements (minimums, then the
+        requirements expression) and deal breakers are checked exactly once and
+        only their survivors are scored
+        Returns parallel (rows, scores) sequences (NumPy arrays for the numpy
+        engine) and the PipelineStats for the run; zero scores stay eligible
+        """
+        stats = PipelineStats(runs=1, rows_considered=len(self._store))
+        candidates, remaining, stats.outside_regions = self._candidates(criteria)
         
-        for criterion, weighted_score in sorted(breakdown.items(), key=lambda x: x[1], reverse=True):
-            display_name = criteria_names.get(criterion, criterion)
-            explanation += f"  {display_name:.<40} {weighted_score:>6.2f}\n"
+        if self.engine == 'numpy':
+            raw, normalized = self._store.numpy_matrices()
+            weights = np.array(criteria.weights, dtype=np.float64)
+            indexes = list(criteria.weight_indexes)
+            
+            mask = np.uint64(self._store.deal_breaker_mask(criteria.deal_breakers))
+            dense = candidates is None or 2 * len(candidates) > len(self._store)
+            if dense:
+                # Filters are not selective: a contiguous product plus a mask is cheaper than gathering
+                if candidates is None:
+                    eligible = np.ones(len(self._store), dtype=bool)
+                else:
+                    eligible = np.zeros(len(self._store), dtype=bool)
+                    eligible[np.frombuffer(candidates, dtype=np.int64)] = True
+                for index, min_value in remaining:
+                    eligible &= raw[index] >= min_value
+                if criteria.expression is not None:
+                    eligible &= _requirement_mask(criteria.expression, self._store, raw)
+                rows = np.flatnonzero(eligible)
+            else:
+                # Narrow to region and requirement survivors first so only they get scored
+                rows = np.frombuffer(candidates, dtype=np.int64)
+                for index, min_value in remaining:
+                    rows = rows[raw[index, rows] >= min_value]
+                if criteria.expression is not None:
+                    rows = rows[_requirement_mask(criteria.expression, self._store, raw, rows)]
+            if mask:
+                passed = len(rows)
+                rows = rows[(np.frombuffer(self._store.deal_breaker_bits, dtype=np.uint64)[rows] & mask) == 0]
+                stats.failed_deal_breakers = passed - len(rows)
+            if dense:
+                scores = (weights @ normalized[indexes])[rows]
+            else:
+                scores = weights @ normalized[np.ix_(indexes, rows)]
+            stats.scored_zero = int(np.count_nonzero(scores == 0))
+        else:
+            if candidates is None:
+                rows = range(len(self._store))
+            else:
+                probes = [(self._store.columns[index], min_value) for index, min_value in remaining]
+                rows = [row for row in candidates if all(column[row] >= min_value for column, min_value in probes)]
+            if criteria.expression is not None:
+                # The expression runs as one generated closure per row
+                rows = filter(_requirement_predicate(criteria.expression, self._store), rows)
+            
+            # Resolve weighted criteria to normalized columns once for the whole pass
+            weighted = [
+                (self._store.normalized_column(index), weight)
+                for index, weight in zip(criteria.weight_indexes, criteria.weights)
+            ]
+            rows = list(rows)
+            if criteria.deal_breakers:
+                passed = len(rows)
+                rows = self._without_deal_breakers(criteria, rows)
+                stats.failed_deal_breakers = passed - len(rows)
+            scores = []
+            for row in rows:
+                score = 0
+                for column, weight in weighted:
+                    score += column[row] * weight
+                scores.append(score)
+            stats.scored_zero = scores.count(0)
         
-        explanation += "\nKey Statistics:\n"
-        explanation += "-" * 60 + "\n"
-        explanation += f"  Cost of Living Index: {country.cost_of_living_index}/100 (lower is cheaper)\n"
-        explanation += f"  Safety Index: {country.safety_index}/100\n"
-        explanation += f"  Healthcare Index: {country.healthcare_index}/100\n"
-        explanation += f"  Average Internet Speed: {country.internet_speed} Mbps\n"
-        explanation += f"  Expat Community: {country.expat_community_size}\n"
+        stats.scored = len(rows)
+        stats.failed_requirements = (
+            stats.rows_considered - stats.outside_regions - stats.failed_deal_breakers - stats.scored
+        )
+        return rows, scores, stats
+    
+    def _top_rows(self, rows, scores, top_n: int) -> List[Tuple[int, float]]:
+        """
+        Select the top_n (row, score) pairs in rank order without a full sort
+        Ties are broken by country name so results are deterministic
+        """
+        names = self._store.names
+        if top_n <= 0 or not len(rows):
+            return []
         
-        return explanation
+        # Select by score first and keep everything scoring at least the top_n-th best,
+        # so names are only read for the survivors and boundary ties still get sorted by name
+        if isinstance(rows, list):
+            pairs = zip(rows, scores)
+            if len(rows) > top_n:
+                cutoff = heapq.nlargest(top_n, scores)[-1]
+                pairs = [(row, score) for row, score in pairs if score >= cutoff]
+        else:
+            if len(rows) > top_n:
+                cutoff = -np.partition(-scores, top_n - 1)[top_n - 1]
+                keep = scores >= cutoff
+                rows, scores = rows[keep], scores[keep]
+            pairs = zip(rows.tolist(), scores.tolist())
+        ranked = sorted(pairs, key=lambda pair: (-pair[1], names[pair[0]]))
+        return ranked[:top_n]
+    
+    def _build_results(self, criteria: CompiledCriteria, ranked: List[Tuple[int, float]],
+                       first_rank: int = 1, version: Optional[int] = None) -> RecommendationSet:
+        """Pack selected rows into a RecommendationSet; breakdowns wait until a caller reads them"""
+        return RecommendationSet.from_ranked(self._store, criteria, ranked, first_rank, version)
+    
+    def recommend_countries_batch(self, criteria_list: List[Union[UserCriteria, CompiledCriteria]],
+                                  top_n: int = 5) -> List[RecommendationSet]:
+        """
+        Recommend countries for many users at once
+        Returns one recommend_countries-style result list per criteria, in order
+        """
+        if self.engine != 'numpy':
+            return [self.recommend_countries(criteria, top_n) for criteria in criteria_list]
+        
+        raw, normalized = self._store.numpy_matrices()
+        results = []
+        # Score users in chunks sized to the store, so the users x countries matrices stay within the budget
+        chunk_size = max(1, self.BATCH_MEMORY_BYTES // (9 * max(1, len(self._store))))
+        for start in range(0, len(criteria_list), chunk_size):
+            chunk = [self._compile(criteria) for criteria in criteria_list[start:start + chunk_size]]
+            
+            # Stack every user's weights and thresholds into (users, metrics) matrices
+            weights = np.zeros((len(chunk), len(METRIC_FIELDS)))
+            thresholds = np.full((len(chunk), len(METRIC_FIELDS)), -np.inf)
+            for user, criteria in enumerate(chunk):
+                weights[user, list(criteria.weight_indexes)] = criteria.weights
+                for index, min_value in criteria.requirements:
+                    thresholds[user, index] = min_value
+            
+            # Every user x country total in one matrix product, requirements as one mask
+            totals = weights @ normalized
+            eligible = np.ones(totals.shape, dtype=bool)
+            for index in np.flatnonzero(np.isfinite(thresholds).any(axis=0)):
+                eligible &= raw[index] >= thresholds[:, index, None]
+            
+            for user, criteria in enumerate(chunk):
+                outside_regions = 0
+                if criteria.preferred_regions:
+                    in_regions = np.zeros(len(self._store), dtype=bool)
+                    in_regions[np.frombuffer(self._store.region_rows(criteria.preferred_regions), dtype=np.int64)] = True
+                    outside_regions = len(self._store) - int(np.count_nonzero(in_regions))
+                    eligible[user] &= in_regions
+                if criteria.expression is not None:
+                    eligible[user] &= _requirement_mask(criteria.expression, self._store, raw)
+                rows = np.flatnonzero(eligible[user])
+                failed_deal_breakers = 0
+                mask = np.uint64(self._store.deal_breaker_mask(criteria.deal_breakers))
+                if mask:
+                    passed = len(rows)
+                    rows = rows[(np.frombuffer(self._store.deal_breaker_bits, dtype=np.uint64)[rows] & mask) == 0]
+                    failed_deal_breakers = passed - len(rows)
+                scores = totals[user, rows]
+                ranked = self._top_rows(rows, scores, top_n)
+                self._record_stats(PipelineStats(
+                    runs=1,
+                    rows_considered=len(self._store),
+                    outside_regions=outside_regions,
+                    failed_requirements=len(self._store) - outside_regions - failed_deal_breakers - len(rows),
+                    failed_deal_breakers=failed_deal_breakers,
+                    scored=len(rows),
+                    scored_zero=int(np.count_nonzero(scores == 0)),
+                    returned=len(ranked)
+                ))
+                results.append(self._build_results(criteria, ranked))
+        return results
+    
+    def explain_recommendation(self, country: CountryData, score: float, breakdown: Dict) -> str:
+        """Generate human-readable explanation for recommendation"""
+        return _render_explanation(country, score, breakdown)
+    
+    def explain_many(self, results: Iterable[Tuple[CountryData, float, Dict]]) -> List[str]:
+        """Explanations for a list of (country, score, breakdown) results, e.g. a whole recommendation page"""
+        return [_render_explanation(country, score, breakdown) for country, score, breakdown in results]
+
+
+class _Flight:
+    """One in-progress computation of AsyncCountryRelocationAgent and how many requests await it"""
+    __slots__ = ('future', 'waiters')
+    
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class AsyncCountryRelocationAgent:
+    """
+    asyncio front end for a CountryRelocationAgent
+    Scoring runs in an executor so the event loop stays responsive;
+    concurrent identical requests share one computation (single-flight),
+    and a request cancelled by its client (e.g. on disconnect) stops
+    waiting at once. The wrapped agent is only ever used by one thread at a
+    time, and results come back with their breakdowns already computed, so
+    reading breakdown or explain() on the event loop does no store work.
+    asyncio itself is imported on first use, not with this module
+    """
+    
+    def __init__(self, agent: Optional[CountryRelocationAgent] = None, executor=None, **agent_options):
+        """
+        agent is the CountryRelocationAgent to wrap; without one it is built
+        from agent_options (see CountryRelocationAgent)
+        executor runs the scoring (a one-thread pool by default); the agent
+        is locked while in use, so more workers buy no parallelism
+        """
+        self.agent = agent if agent is not None else CountryRelocationAgent(**agent_options)
+        self.coalesced = 0  # Requests that joined a computation already in flight
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple, _Flight] = {}
+    
+    def _call(self, function, *args):
+        with self._lock:
+            results = function(*args)
+            # Compute breakdowns here, under the lock, rather than when the caller reads them on the loop
+            for result_set in ([results] if isinstance(results, RecommendationSet) else results):
+                result_set.materialize()
+            return results
+    
+    def _get_executor(self):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='relocation-agent')
+        return self._executor
+    
+    async def _single_flight(self, key: Tuple, function, *args):
+        """
+        Await function(*args) in the executor, sharing the call with every
+        concurrent request for the same key
+        A cancelled request stops waiting immediately; the computation is
+        cancelled too once nobody awaits it (a call that already started
+        runs to completion in its thread and its result is dropped)
+        """
+        import asyncio
+        flight = self._in_flight.get(key)
+        if flight is None:
+            future = asyncio.get_running_loop().run_in_executor(self._get_executor(), self._call, function, *args)
+            flight = self._in_flight[key] = _Flight(future)
+            future.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            # Shielded, so cancelling one waiter does not cancel the shared computation
+            return await asyncio.shield(flight.future)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.future.done():
+                flight.future.cancel()
+                self._land(key, flight)
+            raise
+        finally:
+            flight.waiters -= 1
+    
+    def _land(self, key: Tuple, flight: _Flight):
+        """Forget a finished or abandoned flight; later requests start a fresh one"""
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+    
+    async def recommend(self, criteria: Union[UserCriteria, CompiledCriteria], top_n: int = 5) -> RecommendationSet:
+        """recommend_countries without blocking the event loop"""
+        compiled = CountryRelocationAgent._compile(criteria)
+        return await self._single_flight(
+            ('recommend', compiled, top_n), self.agent.recommend_countries, compiled, top_n
+        )
+    
+    async def recommend_page(self, criteria: Union[UserCriteria, CompiledCriteria], number: int,
+                             page_size: int = 10) -> RecommendationSet:
+        """recommend_page without blocking the event loop; the first page of a ranking pays for scoring"""
+        compiled = CountryRelocationAgent._compile(criteria)
+        return await self._single_flight(
+            ('page', compiled, number, page_size), self.agent.recommend_page, compiled, number, page_size
+        )
+    
+    async def recommend_batch(self, criteria_list: List[Union[UserCriteria, CompiledCriteria]],
+                              top_n: int = 5) -> List[RecommendationSet]:
+        """recommend_countries_batch without blocking the event loop"""
+        compiled = tuple(CountryRelocationAgent._compile(criteria) for criteria in criteria_list)
+        return await self._single_flight(
+            ('batch', compiled, top_n), self.agent.recommend_countries_batch, list(compiled), top_n
+        )
+    
+    def close(self):
+        """Shut down the default executor and release the agent's dataset"""
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.agent.close()
+    
+    async def __aenter__(self) -> 'AsyncCountryRelocationAgent':
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
 
 
 def main():
@@ -0,0 +1,87 @@
+"""AsyncCountryRelocationAgent shares identical in-flight requests and honours cancellation"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from country_relocation_agent import AsyncCountryRelocationAgent, CountryRelocationAgent, UserCriteria
+
+SAFETY = UserCriteria(weights={'safety_index': 1.0})
+
+
+@pytest.fixture
+def blocked_executor():
+    """A one-thread executor whose worker is busy until release is set, so new calls queue behind it"""
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(release.wait)
+    yield executor, release
+    release.set()
+    executor.shutdown(wait=True)
+
+
+def _counting_service(executor) -> AsyncCountryRelocationAgent:
+    """A service whose agent counts the recommend_countries calls that actually run"""
+    agent = CountryRelocationAgent(cache_size=0)
+    service = AsyncCountryRelocationAgent(agent, executor=executor)
+    service.calls = 0
+    recommend_countries = agent.recommend_countries
+
+    def counted(*args):
+        service.calls += 1
+        return recommend_countries(*args)
+    agent.recommend_countries = counted
+    return service
+
+
+def test_identical_requests_join_one_computation(blocked_executor):
+    executor, release = blocked_executor
+    service = _counting_service(executor)
+
+    async def run():
+        tasks = [asyncio.create_task(service.recommend(criteria)) for criteria in (SAFETY, SAFETY, UserCriteria())]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks)
+    first, joined, other = asyncio.run(run())
+    assert joined is first and other is not first
+    assert service.coalesced == 1 and service.calls == 2
+    assert not service._in_flight
+
+
+def test_cancelling_the_only_waiter_drops_a_queued_call(blocked_executor):
+    executor, release = blocked_executor
+    service = _counting_service(executor)
+
+    async def run():
+        task = asyncio.create_task(service.recommend(SAFETY))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not service._in_flight
+    asyncio.run(run())
+    release.set()
+    executor.shutdown(wait=True)
+    assert service.calls == 0
+
+
+def test_cancelling_one_waiter_still_delivers_to_the_other(blocked_executor):
+    executor, release = blocked_executor
+    service = _counting_service(executor)
+
+    async def run():
+        cancelled = asyncio.create_task(service.recommend(SAFETY))
+        kept = asyncio.create_task(service.recommend(SAFETY))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await kept
+    results = asyncio.run(run())
+    assert service.calls == 1 and service.coalesced == 1
+    assert [country.name for country, _, _ in results] == \
+        [country.name for country, _, _ in service.agent.recommend_countries(SAFETY)]
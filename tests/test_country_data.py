@@ -0,0 +1,35 @@
+"""CountryData's constructor follows COUNTRY_FIELDS, including metrics added to METRIC_SPECS"""
+
+import pytest
+
+import country_relocation_agent
+from country_relocation_agent import COUNTRY_FIELDS, METRIC_FIELDS, CountryData
+
+METRICS = [float(value) for value in range(10, 10 * (len(METRIC_FIELDS) + 1), 10)]
+
+
+def test_positional_and_keyword_arguments_agree():
+    positional = CountryData('Atlantis', *METRICS, 'Large', 'Europe')
+    keywords = CountryData(name='Atlantis', expat_community_size='Large', region='Europe',
+                           **dict(zip(METRIC_FIELDS, METRICS)))
+    assert positional.to_dict() == keywords.to_dict()
+    assert positional.to_dict() == dict(zip(COUNTRY_FIELDS, ['Atlantis', *METRICS, 'Large', 'Europe', '']))
+
+
+@pytest.mark.parametrize('args, fields, message', [
+    ((*METRICS,), {}, "missing required arguments: 'expat_community_size'"),
+    ((*METRICS, 'Large'), {'safety_index': 1}, "multiple values for argument 'safety_index'"),
+    ((*METRICS, 'Large'), {'safety': 1}, "unexpected keyword argument 'safety'"),
+    ((*METRICS, 'Large', '', '', ''), {}, "takes at most"),
+])
+def test_bad_arguments_raise_type_error(args, fields, message):
+    with pytest.raises(TypeError, match=message):
+        CountryData('Atlantis', *args, **fields)
+
+
+def test_new_metric_specs_extend_the_constructor(monkeypatch):
+    metric_fields = METRIC_FIELDS + ('air_quality',)
+    monkeypatch.setattr(country_relocation_agent, 'METRIC_FIELDS', metric_fields)
+    monkeypatch.setattr(country_relocation_agent, 'COUNTRY_FIELDS', ('name',) + metric_fields + COUNTRY_FIELDS[-3:])
+    country = CountryData('Atlantis', *METRICS, 75, 'Small')
+    assert country._row == ('Atlantis', *METRICS, 75.0, 'Small', '', '')
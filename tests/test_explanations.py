@@ -0,0 +1,15 @@
+"""explain_recommendation prints the stored statistics without rounding them"""
+
+import pytest
+
+from country_relocation_agent import METRIC_FIELDS, CountryData, CountryRelocationAgent
+
+
+@pytest.mark.parametrize('value, printed', [
+    (45.0, '45'), (123.4567, '123.4567'), (1234567.0, '1234567'), (0.1 + 0.2, '0.30000000000000004'),
+])
+def test_statistics_print_whole_numbers_as_integers_and_the_rest_in_full(value, printed):
+    country = CountryData('Atlantis', *[value] * len(METRIC_FIELDS), 'Medium')
+    explanation = CountryRelocationAgent().explain_recommendation(country, 50.0, {})
+    assert f"Cost of Living Index: {printed}/100" in explanation
+    assert f"Average Internet Speed: {printed} Mbps" in explanation
@@ -0,0 +1,149 @@
+"""Derived data patched by update_country and upsert_many matches a store built from scratch"""
+
+import random
+
+import numpy as np
+import pytest
+
+from country_relocation_agent import (
+    METRIC_FIELDS, METRIC_INDEX, METRIC_SPECS, CountryRelocationAgent, CountryStore, SortedIndex, UserCriteria
+)
+
+REGIONS = ('', 'Europe', 'Asia', 'Americas')
+EXPAT_SIZES = ('Small', 'Medium', 'Large')
+
+CRITERIA = [
+    UserCriteria(),
+    UserCriteria(weights={'safety_index': 0.5, 'internet_speed': 0.5}, min_requirements={'safety_index': 40}),
+    UserCriteria(min_requirements={'cost_of_living_index': 30, 'visa_ease': 20},
+                 deal_breakers=['small_expat_community', 'slow_internet']),
+    UserCriteria(preferred_regions=['Europe', 'Asia'], deal_breakers=['unsafe', 'high_cost'],
+                 requirements="internet_speed > 100 or expat_community_size == Large"),
+]
+
+
+def _random_fields(rng: random.Random, names) -> dict:
+    """Values for some of the given fields; coarse metrics so ties are common"""
+    fields = {}
+    for name in names:
+        if name == 'expat_community_size':
+            fields[name] = rng.choice(EXPAT_SIZES)
+        elif name == 'region':
+            fields[name] = rng.choice(REGIONS)
+        elif name == 'internet_speed':
+            fields[name] = rng.choice([0, 25, 50, 120, 500, 900])
+        else:
+            fields[name] = rng.randrange(0, 101, 10)
+    return fields
+
+
+def _random_store(rng: random.Random, rows: int) -> CountryStore:
+    store = CountryStore()
+    for row in range(rows):
+        fields = _random_fields(rng, METRIC_FIELDS + ('expat_community_size', 'region'))
+        store.append_row(f"Country {row}", [fields[name] for name in METRIC_FIELDS],
+                         fields['expat_community_size'], fields['region'])
+    return store
+
+
+def _mutate(rng: random.Random, agent: CountryRelocationAgent, step: int):
+    """One random update_country or upsert_many call touching one to three fields of existing or new rows"""
+    store = agent.countries
+    changeable = METRIC_FIELDS + ('expat_community_size', 'region')
+    if rng.random() < 0.6:
+        name = store.names[rng.randrange(len(store))]
+        agent.update_country(name, **_random_fields(rng, rng.sample(changeable, rng.randint(1, 3))))
+        return
+    records = []
+    for _ in range(rng.randint(1, 4)):
+        if rng.random() < 0.5:
+            records.append(dict(_random_fields(rng, changeable), name=f"New {step}.{len(records)}"))
+        else:
+            fields = _random_fields(rng, rng.sample(changeable, rng.randint(1, 3)))
+            records.append(dict(fields, name=store.names[rng.randrange(len(store))]))
+    agent.upsert_many(records)
+
+
+def _ranking(agent: CountryRelocationAgent, criteria: UserCriteria):
+    return [(country.name, score, breakdown)
+            for country, score, breakdown in agent.recommend_countries(criteria, top_n=len(agent.countries))]
+
+
+def _assert_derived_data_current(store: CountryStore):
+    fresh = store.copy()
+    for index, sorted_index in store._sorted_indexes.items():
+        rebuilt = SortedIndex(store.columns[index])
+        assert sorted_index.rows == rebuilt.rows and sorted_index.values == rebuilt.values, METRIC_FIELDS[index]
+    for index in range(len(METRIC_FIELDS)):
+        normalized = store._current_normalized(index)
+        if normalized is not None:
+            assert normalized == fresh.normalized_column(index), METRIC_FIELDS[index]
+    if store._matrices is not None:
+        raw, normalized = store._matrices
+        fresh_raw, fresh_normalized = fresh.numpy_matrices()
+        assert np.array_equal(raw, fresh_raw)
+        np.testing.assert_allclose(normalized, fresh_normalized, rtol=1e-12)
+    for breaker, bit in store._deal_breaker_bit.items():
+        fresh_bit = fresh._compile_deal_breaker(breaker)
+        assert [bool(bits & bit) for bits in store.deal_breaker_bits] == \
+            [bool(bits & fresh_bit) for bits in fresh.deal_breaker_bits], breaker.description
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_updates_match_a_rebuilt_store(seed):
+    rng = random.Random(seed)
+    store = _random_store(rng, 150)
+    # Both engines would share the store's result cache, so only the NumPy one uses it
+    agents = {
+        'numpy': CountryRelocationAgent(engine='numpy', shared=False),
+        'python': CountryRelocationAgent(engine='python', cache_size=0, shared=False),
+    }
+    for agent in agents.values():
+        agent.countries = store
+    # Build every kind of derived data up front so the mutations have to patch it
+    for agent in agents.values():
+        for criteria in CRITERIA:
+            agent.recommend_countries(criteria, top_n=len(store))
+    assert store._sorted_indexes and store._normalized and store._matrices is not None and store._deal_breaker_bit
+
+    for step in range(40):
+        _mutate(rng, agents['python'] if step % 2 else agents['numpy'], step)
+        _assert_derived_data_current(store)
+        for engine, agent in agents.items():
+            reference = CountryRelocationAgent(engine=engine, cache_size=0, shared=False)
+            reference.countries = store.copy()
+            for criteria in CRITERIA:
+                assert _ranking(agent, criteria) == _ranking(reference, criteria), (step, engine, criteria)
+
+
+def test_cache_only_drops_results_whose_columns_changed():
+    store = _random_store(random.Random(7), 50)
+    agent = CountryRelocationAgent(shared=False)
+    agent.countries = store
+    safety = UserCriteria(weights={'safety_index': 1.0})
+    results = agent.recommend_countries(safety)
+    name = results[0].country.name
+
+    agent.update_country(name, climate_score=store.columns[METRIC_INDEX['climate_score']][results[0].row_id] + 1)
+    assert agent.recommend_countries(safety) is results
+    assert store.column_versions[METRIC_INDEX['safety_index']] < store.version
+
+    agent.update_country(name, safety_index=0)
+    updated = agent.recommend_countries(safety)
+    assert updated is not results and updated[0].country.name != name
+    assert agent.cache_stats().stale == 1
+
+    agent.upsert_many([dict({field: 100 for field in METRIC_FIELDS}, name='Andorra', expat_community_size='Large')])
+    assert agent.recommend_countries(safety)[0].country.name == 'Andorra'
+    assert agent.cache_stats().stale == 2
+
+
+def test_row_local_normalization_is_patched_not_rebuilt():
+    store = _random_store(random.Random(8), 30)
+    index = METRIC_INDEX['internet_speed']
+    assert METRIC_SPECS['internet_speed'].row_local
+    column = store.normalized_column(index)
+    store.set_value(3, index, 250.0)
+    store.append_row('Appended', [50.0] * len(METRIC_FIELDS), 'Medium')
+    assert store.normalized_column(index) is column
+    assert column == store.copy().normalized_column(index)
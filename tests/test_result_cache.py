@@ -0,0 +1,40 @@
+"""The recommend_countries cache is shared by every agent on a store"""
+
+from country_relocation_agent import DEFAULT_DATA_PATH, CountryRelocationAgent, CountryStore, UserCriteria
+
+
+def _agent(store, **options) -> CountryRelocationAgent:
+    agent = CountryRelocationAgent(**options)
+    agent.countries = store
+    return agent
+
+
+def test_agents_on_one_store_share_results():
+    store = CountryStore.from_file(DEFAULT_DATA_PATH).freeze()
+    results = _agent(store).recommend_countries(UserCriteria())
+    other = _agent(store)
+    assert other.recommend_countries(UserCriteria()) is results
+    assert other.cache_stats().hits == 1 and other.cache is store.result_cache()
+
+
+def test_cache_size_zero_bypasses_the_shared_cache():
+    store = CountryStore.from_file(DEFAULT_DATA_PATH)
+    results = _agent(store).recommend_countries(UserCriteria())
+    assert _agent(store, cache_size=0).recommend_countries(UserCriteria()) is not results
+    assert store.result_cache().stats().hits == 0
+
+
+def test_cache_keeps_the_largest_requested_size():
+    store = CountryStore.from_file(DEFAULT_DATA_PATH)
+    _agent(store, cache_size=16).recommend_countries(UserCriteria())
+    assert _agent(store, cache_size=256).cache.maxsize == 256
+    assert _agent(store, cache_size=8).cache_stats().maxsize == 256
+
+
+def test_updates_on_a_shared_dataset_leave_its_cache_alone():
+    store = CountryStore.from_file(DEFAULT_DATA_PATH).freeze()
+    reader, writer = _agent(store), _agent(store)
+    results = reader.recommend_countries(UserCriteria())
+    writer.update_country(results[0].country.name, safety_index=0)
+    assert writer.recommend_countries(UserCriteria()) is not results
+    assert reader.recommend_countries(UserCriteria()) is results
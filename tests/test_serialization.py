@@ -0,0 +1,17 @@
+"""dumps_recommendations output does not depend on how the results are held"""
+
+import pytest
+
+from country_relocation_agent import (
+    DEFAULT_DATA_PATH, CountryRelocationAgent, CountryStore, UserCriteria, dumps_recommendations,
+)
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'python'])
+@pytest.mark.parametrize('columnar', [False, True])
+def test_recommendation_sets_serialize_like_their_tuples(engine, columnar):
+    agent = CountryRelocationAgent(engine=engine)
+    agent.countries = CountryStore.from_file(DEFAULT_DATA_PATH)
+    for criteria in (UserCriteria(), UserCriteria(min_requirements={'safety_index': 101})):
+        results = agent.recommend_countries(criteria)
+        assert dumps_recommendations(results, columnar) == dumps_recommendations(list(results), columnar)
@@ -0,0 +1,90 @@
+"""Binary snapshot round trips, older schema versions and damaged files"""
+
+import struct
+import sys
+
+import pytest
+
+from country_relocation_agent import DEFAULT_DATA_PATH, CountryStore, SchemaError
+
+
+@pytest.fixture(scope='module')
+def store():
+    store = CountryStore.from_file(DEFAULT_DATA_PATH)
+    store[0].region = 'Europe'
+    store[1].sub_region = 'Southeast Asia'
+    return store
+
+
+@pytest.fixture
+def snapshot(store, tmp_path):
+    path = tmp_path / 'countries.snap'
+    store.write_snapshot(str(path))
+    return path
+
+
+def _legacy_snapshot(snapshot, store, version: int):
+    """Rewrite a current snapshot as schema version 1 or 2, which had no byte-order field"""
+    data = bytearray(snapshot.read_bytes())
+    data[8:12] = struct.pack('<I', version)
+    del data[40:48]  # The byte-order field follows the 40-byte header
+    if version == 1:
+        labels_size = len('\n'.join(store.region_labels).encode('utf-8'))
+        del data[len(data) - 8 - 4 * len(store) - labels_size:]  # Drop the region block
+    path = snapshot.with_name(f'v{version}.snap')
+    path.write_bytes(bytes(data))
+    return path
+
+
+def test_round_trip(store, snapshot):
+    opened = CountryStore.open_snapshot(str(snapshot))
+    assert list(opened) == list(store)
+    assert opened[0].region == 'Europe' and opened[1].sub_region == 'Southeast Asia'
+
+
+def test_from_file_opens_snapshots(store, snapshot):
+    assert list(CountryStore.from_file(str(snapshot))) == list(store)
+
+
+def test_snapshot_store_copies_on_first_change(store, snapshot):
+    opened = CountryStore.open_snapshot(str(snapshot))
+    opened[0].safety_index = 1
+    assert opened[0].safety_index == 1.0
+    assert CountryStore.open_snapshot(str(snapshot))[0].safety_index == store[0].safety_index
+
+
+def test_version_2_keeps_regions(store, snapshot):
+    opened = CountryStore.open_snapshot(str(_legacy_snapshot(snapshot, store, 2)))
+    assert list(opened) == list(store)
+
+
+def test_version_1_is_untagged(store, snapshot):
+    opened = CountryStore.open_snapshot(str(_legacy_snapshot(snapshot, store, 1)))
+    assert len(opened) == len(store)
+    assert opened.names[5] == store.names[5] and opened[5].climate_score == store[5].climate_score
+    assert {country.region for country in opened} == {''}
+    assert {country.sub_region for country in opened} == {''}
+
+
+@pytest.mark.parametrize('keep', [0, 30, 44, 60, 200, -100, -1])
+def test_truncated_files_are_rejected(snapshot, keep):
+    data = snapshot.read_bytes()
+    snapshot.write_bytes(data[:keep] if keep >= 0 else data[:len(data) + keep])
+    with pytest.raises(SchemaError):
+        CountryStore.open_snapshot(str(snapshot))
+
+
+def test_other_byte_order_is_rejected(snapshot):
+    data = bytearray(snapshot.read_bytes())
+    other = 'big' if sys.byteorder == 'little' else 'little'
+    data[40:48] = other.encode('ascii').ljust(8, b'\0')
+    snapshot.write_bytes(bytes(data))
+    with pytest.raises(SchemaError, match='endian'):
+        CountryStore.open_snapshot(str(snapshot))
+
+
+def test_unknown_files_are_rejected(tmp_path):
+    path = tmp_path / 'other.snap'
+    path.write_bytes(b'PK\x03\x04' + bytes(60))
+    with pytest.raises(SchemaError, match='not a country snapshot'):
+        CountryStore.open_snapshot(str(path))